@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""Benchmark jack-matchmaker against a simulated JACK server.
+
+Runs without a JACK server or libjack by using the simulated ``jacklib`` from the ``fakejack``
+directory next to this script.
+
+For each combination of graph size, number of pattern pairs and matching mode, the following
+phases are measured:
+
+startup
+    Loading the port graph, matching all ports against all pattern pairs and making the
+    resulting connections (as done when the client connects to the server).
+rescan
+    Matching all ports again when all connections are already made (as done when the pattern
+    file is reloaded).
+burst
+    A new client registers a burst of ports, which are matched and connected by processing
+    the resulting JACK notification events.
+
+For each phase, the wall clock time, the number of connections made and the number of calls to
+``jacklib`` functions (each of which would be a ctypes call into libjack) are reported. For the
+burst phase, the number of processed events per second is reported as well.
+
+After the startup phase, the connections made are checked against those computed by a naive
+baseline, which matches every port name, alias and pretty name against every pattern with
+``re.match``. The exit status is 1, if they differ for any combination.
+
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fakejack'))
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jacklib  # noqa: E402
+
+from jackmatchmaker import JackMatchmaker  # noqa: E402
+
+
+PORTS_PER_CLIENT = 16
+server = jacklib.server
+
+
+def populate(num_ports):
+    """Register clients with audio and MIDI input and output ports until ``num_ports`` are
+    registered. Every fourth client gets port aliases and every third client pretty names.
+
+    """
+    audio, midi = jacklib.JACK_DEFAULT_AUDIO_TYPE, jacklib.JACK_DEFAULT_MIDI_TYPE
+    outflags, inflags = jacklib.JackPortIsOutput, jacklib.JackPortIsInput
+    layout = ([('out_%i', outflags, audio)] * 8 + [('in_%i', inflags, audio)] * 4
+              + [('midi_out_%i', outflags, midi)] * 2 + [('midi_in_%i', inflags, midi)] * 2)
+    num_clients = max(1, num_ports // PORTS_PER_CLIENT)
+
+    for i in range(num_ports):
+        client, num = divmod(i, PORTS_PER_CLIENT)
+        name, flags, type_ = layout[num]
+        num = layout[:num].count(layout[num]) + 1
+        port_name = "client%04i:%s" % (client, name % num)
+        aliases = ["alias%04i:%s" % (client, name % num)] if client % 4 == 0 else ()
+        pretty_name = "Pretty %s" % (name % num) if client % 3 == 0 else None
+        server.register_port(port_name, type_, flags, aliases, pretty_name)
+
+    return num_clients
+
+
+def make_patterns(num_patterns, num_clients, exact=False):
+    """Return list of pattern pairs connecting the outputs of one client to the inputs of the
+    next. One in ten pairs uses a pattern without literal client name prefix.
+
+    """
+    patterns = []
+
+    for i in range(num_patterns):
+        src, dst = i % num_clients, (i + 1) % num_clients
+
+        if exact:
+            patterns.append(("client%04i:out_%i" % (src, i % 4 + 1),
+                             "client%04i:in_%i" % (dst, i % 4 + 1)))
+        elif i % 10 == 9:
+            patterns.append((r"(?i).*:monitor_%i$" % i, "client%04i:in_4" % dst))
+        else:
+            patterns.append((r"client%04i:out_(?P<num>[1-4])$" % src,
+                             "client%04i:in_{num}$" % dst))
+
+    return patterns
+
+
+class Phase(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.calls = sum(server.calls.values())
+        self.connects = server.calls['connect']
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.time = time.perf_counter() - self.start
+        self.calls = sum(server.calls.values()) - self.calls
+        self.connects = server.calls['connect'] - self.connects
+
+
+def _names(port):
+    names = [port.name] + list(port.aliases)
+    pretty_name = server.properties.get(port.uuid, {}).get(jacklib.JACK_METADATA_PRETTY_NAME)
+
+    if pretty_name:
+        names.append(port.name.split(':', 1)[0] + ':' + pretty_name)
+
+    return names
+
+
+def _compile(pattern, exact):
+    if not exact or (pattern.startswith('/') and pattern.endswith('/')):
+        return re.compile(pattern.strip('/'))
+
+    return pattern
+
+
+def _match(pattern, name):
+    if isinstance(pattern, str):
+        return pattern == name
+
+    return pattern.match(name)
+
+
+def naive_connections(patterns, exact):
+    """Return set of connections for all output ports of the simulated server matching the
+    pattern pairs, computed without any of the optimizations of jack-matchmaker.
+
+    """
+    ports = list(server.ports.values())
+    inputs = [port for port in ports if port.flags & jacklib.JackPortIsInput]
+    connections = set()
+
+    for port in ports:
+        if not port.flags & jacklib.JackPortIsOutput:
+            continue
+
+        for ptn_output, ptn_input in patterns:
+            ptn_output = _compile(ptn_output, exact)
+
+            for name in _names(port):
+                match = _match(ptn_output, name)
+
+                if not match:
+                    continue
+
+                if match is not True:
+                    template = ptn_input.format_map(defaultdict(str, **match.groupdict()))
+                else:
+                    template = ptn_input
+
+                resolved = _compile(template, exact)
+
+                for input_port in inputs:
+                    if input_port.type == port.type and any(
+                            _match(resolved, input_name) for input_name in _names(input_port)):
+                        connections.add((port.name, input_port.name))
+
+    return connections
+
+
+def process_all_events(matchmaker):
+    events = 0
+
+    while len(matchmaker.events):
+        events += len(matchmaker.events)
+        matchmaker._process_events()
+
+    return events
+
+
+def run(num_ports, num_patterns, exact, burst):
+    server.reset()
+    server.calls.clear()
+    num_clients = populate(num_ports)
+    patterns = make_patterns(num_patterns, num_clients, exact)
+    matchmaker = JackMatchmaker(patterns, exact_matching=exact, debounce=0)
+    matchmaker.connect()
+    result = dict(ports=num_ports, patterns=num_patterns, mode='exact' if exact else 'regex',
+                  burst_size=burst)
+
+    with Phase('startup') as phase:
+        matchmaker._activate()
+        matchmaker._reconcile(matchmaker._refresh(full=True))
+
+    result['startup'] = dict(time=phase.time, connects=phase.connects, calls=phase.calls)
+    result['check'] = server.connections == naive_connections(patterns, exact)
+
+    with Phase('rescan') as phase:
+        matchmaker._reconcile(matchmaker._refresh(full=True))
+
+    result['rescan'] = dict(time=phase.time, connects=phase.connects, calls=phase.calls)
+
+    # Register a new client with ports, which are matched by the patterns for the first client.
+    server.calls.clear()
+    names = ["client0000:out_%i" % (i + 1) for i in range(4)]
+
+    for name in names:
+        server.unregister_port(name)
+
+    process_all_events(matchmaker)
+
+    with Phase('burst') as phase:
+        for i in range(burst):
+            if i < len(names):
+                server.register_port(names[i])
+            else:
+                server.register_port("newclient:port_%i" % i, flags=jacklib.JackPortIsInput)
+
+        events = process_all_events(matchmaker)
+
+    result['burst'] = dict(time=phase.time, connects=phase.connects, calls=phase.calls,
+                           events=events, events_per_sec=events / phase.time if phase.time else 0)
+    matchmaker.close()
+    return result
+
+
+def format_result(result):
+    return ("%(ports)6i %(patterns)5i %(mode)-5s %(burst_size)5i" % result +
+            "".join(" | %8.2f ms %6i %7i" % (result[phase]['time'] * 1000,
+                                              result[phase]['connects'],
+                                              result[phase]['calls'])
+                    for phase in ('startup', 'rescan', 'burst')) +
+            " | %9.0f | %s" % (result['burst']['events_per_sec'],
+                               "ok" if result['check'] else "MISMATCH"))
+
+
+def intlist(arg):
+    return [int(value) for value in arg.split(',')]
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-s', '--sizes', type=intlist, default=[10, 100, 1000, 10000],
+                    help="Comma-separated list of graph sizes (default: 10,100,1000,10000)")
+    ap.add_argument('-p', '--patterns', type=intlist, default=[10, 100, 500],
+                    help="Comma-separated list of pattern pair counts (default: 10,100,500)")
+    ap.add_argument('-b', '--burst', type=intlist, default=[64],
+                    help="Comma-separated list of numbers of ports registered in burst phase "
+                         "(default: 64)")
+    ap.add_argument('-m', '--mode', choices=['regex', 'exact', 'both'], default='both',
+                    help="Matching mode (default: both)")
+    ap.add_argument('-j', '--json', action='store_true',
+                    help="Output results as JSON lines")
+    args = ap.parse_args(args)
+
+    logging.basicConfig(level=logging.ERROR)
+    modes = [False, True] if args.mode == 'both' else [args.mode == 'exact']
+
+    if not args.json:
+        print(" ports  ptns mode  burst | %-25s | %-25s | %-25s |  events/s | check" %
+              ("startup: time conn calls", "rescan: time conn calls", "burst: time conn calls"))
+
+    mismatch = False
+
+    for num_ports in args.sizes:
+        for num_patterns in args.patterns:
+            for exact in modes:
+                for burst in args.burst:
+                    result = run(num_ports, num_patterns, exact, burst)
+                    mismatch = mismatch or not result['check']
+
+                    if args.json:
+                        print(json.dumps(result))
+                    else:
+                        print(format_result(result))
+
+                    sys.stdout.flush()
+
+    return 1 if mismatch else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
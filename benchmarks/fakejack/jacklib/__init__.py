@@ -0,0 +1,436 @@
+"""Simulated, in-process stand-in for the parts of ``jacklib`` used by jack-matchmaker.
+
+Put the parent directory of this package on ``sys.path`` before importing ``jackmatchmaker`` to
+run it without a JACK server (or even ``libjack``) installed. The simulated server is available
+as the module global ``server`` and has methods to register, rename and unregister ports, set
+pretty names, make connections and shut down or restart the server. Notifications are delivered
+to the registered client callbacks synchronously from the thread, which changed the graph.
+
+Every API function call is counted in ``server.calls``, so the number of round-trips, which
+would each be a ctypes call with the real ``jacklib``, can be measured.
+
+"""
+
+import threading
+
+from collections import Counter, namedtuple
+
+
+ENCODING = "utf-8"
+JACK_DEFAULT_AUDIO_TYPE = "32 bit float mono audio"
+JACK_DEFAULT_MIDI_TYPE = "8 bit raw midi"
+JACK_METADATA_PRETTY_NAME = "http://jackaudio.org/metadata/pretty-name"
+
+JackNullOption = 0x00
+JackNoStartServer = 0x01
+
+JackFailure = 0x01
+JackInvalidOption = 0x02
+JackNameNotUnique = 0x04
+JackServerStarted = 0x08
+JackServerFailed = 0x10
+JackServerError = 0x20
+
+JackPortIsInput = 0x1
+JackPortIsOutput = 0x2
+JackPortIsPhysical = 0x4
+JackPortCanMonitor = 0x8
+JackPortIsTerminal = 0x10
+JackPortIsControlVoltage = 0x100
+
+PropertyCreated = 0
+PropertyChanged = 1
+PropertyDeleted = 2
+
+EEXIST = 17
+
+Property = namedtuple("Property", ("key", "value", "type"))
+
+
+class jack_status_t:
+    def __init__(self, value=0):
+        self.value = value
+
+
+class FakePort:
+    __slots__ = ('id', 'uuid', 'name', 'type', 'flags', 'aliases', 'owner')
+
+    def __init__(self, id, uuid, name, type, flags, aliases, owner):
+        self.id = id
+        self.uuid = uuid
+        self.name = name
+        self.type = type
+        self.flags = flags
+        self.aliases = list(aliases)
+        self.owner = owner
+
+
+class FakeClient:
+    def __init__(self, server, name):
+        self.server = server
+        self.name = name
+        self.uuid = server.next_uuid()
+        self.active = False
+        self.callbacks = {}
+
+    def __repr__(self):
+        return "<FakeClient %s>" % self.name
+
+
+class FakeServer:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.calls = Counter()
+        self.error_function = None
+        self.reset()
+
+    def reset(self):
+        """Remove all clients, ports, connections and properties and start the server."""
+        self.running = True
+        self.clients = {}
+        self.ports = {}
+        self.ports_by_id = {}
+        self.connections = set()
+        self.properties = {}
+        self._next_id = 1
+        self._next_uuid = 1
+
+    def next_uuid(self):
+        self._next_uuid += 1
+        return self._next_uuid
+
+    # ---------------------------------------------------------------------------------------------
+    # Simulation API
+
+    def notify(self, kind, *args, exclude=None):
+        for client in list(self.clients.values()):
+            if client.active and client is not exclude:
+                callback, arg = client.callbacks.get(kind, (None, None))
+
+                if callback is not None:
+                    callback(*args, arg)
+
+    def register_port(self, name, type=JACK_DEFAULT_AUDIO_TYPE, flags=JackPortIsOutput,
+                      aliases=(), pretty_name=None, owner=None):
+        with self.lock:
+            port = FakePort(self._next_id, self.next_uuid(), name, type, flags, aliases, owner)
+            self._next_id += 1
+            self.ports[name] = port
+            self.ports_by_id[port.id] = port
+
+            if pretty_name is not None:
+                self.properties.setdefault(port.uuid, {})[JACK_METADATA_PRETTY_NAME] = pretty_name
+
+        self.notify('port_registration', port.id, 1)
+
+        if pretty_name is not None:
+            self.notify('property_change', port.uuid, _e(JACK_METADATA_PRETTY_NAME),
+                        PropertyCreated)
+
+        return port
+
+    def unregister_port(self, name):
+        with self.lock:
+            port = self.ports[name]
+
+            for src, dst in list(self.connections):
+                if name in (src, dst):
+                    self.disconnect(src, dst)
+
+        self.notify('port_registration', port.id, 0)
+
+        # Like the real JACK server, keep the port in the ID table, so port_by_id still returns
+        # it after it was unregistered (port IDs are never re-used here, though).
+        with self.lock:
+            del self.ports[name]
+            self.properties.pop(port.uuid, None)
+
+    def rename_port(self, old_name, new_name):
+        with self.lock:
+            port = self.ports.pop(old_name)
+            port.name = new_name
+            self.ports[new_name] = port
+            self.connections = {(new_name if src == old_name else src,
+                                  new_name if dst == old_name else dst)
+                                 for src, dst in self.connections}
+
+        self.notify('port_rename', port.id, _e(old_name), _e(new_name))
+
+    def set_pretty_name(self, name, pretty_name):
+        port = self.ports[name]
+
+        with self.lock:
+            props = self.properties.setdefault(port.uuid, {})
+            change = PropertyChanged if JACK_METADATA_PRETTY_NAME in props else PropertyCreated
+            props[JACK_METADATA_PRETTY_NAME] = pretty_name
+
+        self.notify('property_change', port.uuid, _e(JACK_METADATA_PRETTY_NAME), change)
+
+    def connect(self, src, dst):
+        with self.lock:
+            if src not in self.ports or dst not in self.ports:
+                return -1
+
+            if (src, dst) in self.connections:
+                return EEXIST
+
+            self.connections.add((src, dst))
+
+        self.notify('port_connect', self.ports[src].id, self.ports[dst].id, 1)
+        return 0
+
+    def disconnect(self, src, dst):
+        with self.lock:
+            if (src, dst) not in self.connections:
+                return -1
+
+            self.connections.discard((src, dst))
+
+        self.notify('port_connect', self.ports[src].id, self.ports[dst].id, 0)
+        return 0
+
+    def shutdown(self):
+        """Stop the server and notify all clients via their shutdown callback."""
+        clients = list(self.clients.values())
+        self.running = False
+
+        for client in clients:
+            callback, arg = client.callbacks.get('shutdown', (None, None))
+
+            if callback is not None:
+                callback(arg)
+
+        self.clients = {}
+
+    def connections_of(self, name):
+        return [dst if src == name else src
+                for src, dst in self.connections if name in (src, dst)]
+
+
+server = FakeServer()
+
+
+def _e(s, encoding=ENCODING):
+    return s.encode(encoding) if isinstance(s, str) else s
+
+
+def _d(s, encoding=ENCODING):
+    return s.decode(encoding) if isinstance(s, bytes) else s
+
+
+def _counted(func):
+    name = func.__name__
+
+    def wrapper(*args, **kwargs):
+        server.calls[name] += 1
+        return func(*args, **kwargs)
+
+    wrapper.__name__ = name
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def _port(client, port):
+    if isinstance(port, FakePort):
+        return port if port.name in server.ports else None
+
+    return server.ports.get(_d(port))
+
+
+# -------------------------------------------------------------------------------------------------
+# Client functions
+
+@_counted
+def client_open(client_name, options, status, uuid=""):
+    if not server.running:
+        status.value = JackFailure | JackServerFailed
+        return None
+
+    name = client_name
+    status.value = 0
+
+    if name in server.clients:
+        i = 2
+        while "%s-%02i" % (client_name, i) in server.clients:
+            i += 1
+
+        name = "%s-%02i" % (client_name, i)
+        status.value = JackNameNotUnique
+
+    client = server.clients[name] = FakeClient(server, name)
+    return client
+
+
+@_counted
+def client_close(client):
+    server.clients.pop(client.name, None)
+    return 0
+
+
+@_counted
+def get_client_name(client):
+    return _e(client.name)
+
+
+@_counted
+def client_get_uuid(client):
+    return str(client.uuid)
+
+
+@_counted
+def activate(client):
+    client.active = True
+    return 0
+
+
+@_counted
+def deactivate(client):
+    client.active = False
+    return 0
+
+
+def _set_callback(kind):
+    def set_callback(client, callback, arg=None):
+        client.callbacks[kind] = (callback, arg)
+        return 0
+
+    set_callback.__name__ = 'set_%s_callback' % kind
+    return _counted(set_callback)
+
+
+set_port_registration_callback = _set_callback('port_registration')
+set_port_connect_callback = _set_callback('port_connect')
+set_port_rename_callback = _set_callback('port_rename')
+set_property_change_callback = _set_callback('property_change')
+on_shutdown = _set_callback('shutdown')
+
+
+def set_error_function(error_callback):
+    server.error_function = error_callback
+
+
+def free(ptr):
+    pass
+
+
+# -------------------------------------------------------------------------------------------------
+# Port functions
+
+@_counted
+def get_ports(client, port_name_pattern=None, type_name_pattern=None, flags=0):
+    with server.lock:
+        names = [_e(port.name) for port in server.ports.values()
+                 if not flags or port.flags & flags == flags]
+
+    names.append(None)
+    return names
+
+
+@_counted
+def port_by_name(client, port_name):
+    return _port(client, port_name)
+
+
+@_counted
+def port_by_id(client, port_id):
+    return server.ports_by_id.get(port_id)
+
+
+@_counted
+def port_name(port):
+    return port.name
+
+
+@_counted
+def port_short_name(port):
+    return port.name.split(':', 1)[-1]
+
+
+@_counted
+def port_flags(port):
+    return port.flags
+
+
+@_counted
+def port_type(port):
+    return port.type
+
+
+@_counted
+def port_uuid(port):
+    return port.uuid if port else -1
+
+
+@_counted
+def port_is_mine(client, port):
+    return port.owner is client
+
+
+@_counted
+def port_get_aliases(port):
+    aliases = (port.aliases + ["", ""])[:2]
+    return (len(port.aliases), aliases[0], aliases[1])
+
+
+@_counted
+def port_connected(port):
+    return len(server.connections_of(port.name))
+
+
+@_counted
+def port_connected_to(port, port_name):
+    port_name = _d(port_name)
+    return ((port.name, port_name) in server.connections
+            or (port_name, port.name) in server.connections)
+
+
+@_counted
+def port_get_connections(port):
+    yield from server.connections_of(port.name)
+
+
+@_counted
+def port_get_all_connections(client, port):
+    yield from server.connections_of(port.name)
+
+
+@_counted
+def connect(client, source_port, destination_port):
+    return server.connect(_d(source_port), _d(destination_port))
+
+
+@_counted
+def disconnect(client, source_port, destination_port):
+    return server.disconnect(_d(source_port), _d(destination_port))
+
+
+# -------------------------------------------------------------------------------------------------
+# Meta data
+
+@_counted
+def get_all_properties(encoding=ENCODING):
+    with server.lock:
+        return {subject: [Property(key, value, "text/plain") for key, value in props.items()]
+                for subject, props in server.properties.items() if props}
+
+
+@_counted
+def get_property(subject, key, encoding=ENCODING):
+    value = server.properties.get(subject, {}).get(key)
+
+    if value is not None:
+        return Property(key, value, "text/plain")
+
+
+@_counted
+def get_port_property(client, port, key, encoding=ENCODING):
+    port = _port(client, port)
+
+    if port is not None:
+        return get_property(port.uuid, key, encoding)
+
+
+@_counted
+def get_port_pretty_name(client, port, encoding=ENCODING):
+    prop = get_port_property(client, port, JACK_METADATA_PRETTY_NAME, encoding)
+    return prop.value if prop else None
@@ -0,0 +1,27 @@
+"""Helper functions mirroring ``jacklib.helpers`` for the simulated ``jacklib``."""
+
+from . import ENCODING, JackNameNotUnique, JackServerFailed
+
+
+def get_jack_status_error_string(cStatus):
+    status = cStatus.value
+    errors = []
+
+    if status & JackNameNotUnique:
+        errors.append("The desired client name was not unique")
+    if status & JackServerFailed:
+        errors.append("Unable to connect to the JACK server")
+
+    return ";\n".join(errors) + "." if errors else ""
+
+
+def c_char_p_p_to_list(c_char_p_p, encoding=ENCODING, errors="ignore"):
+    result = []
+
+    for name in c_char_p_p or ():
+        if name is None:
+            break
+
+        result.append(name.decode(encoding=encoding, errors=errors))
+
+    return result
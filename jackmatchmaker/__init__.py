@@ -35,38 +35,73 @@ Read port patterns from file 'patterns.txt' and run in verbose mode:
 
     jack-matchmaker -v -p patterns.txt
 
+Accept pattern pair changes on the default control socket and add a pattern pair
+to the running process:
+
+    jack-matchmaker -S -p patterns.txt
+    jack-matchmaker ctl add 'synth:out_(?P<ch>[12])$' 'system:playback_{ch}'
+
+Test the patterns in 'patterns.txt' against a saved snapshot of the port graph
+without connecting to a JACK server:
+
+    jack-matchmaker -oican --format json > snapshot.json
+    jack-matchmaker --plan snapshot.json -p patterns.txt
+
 See https://github.com/SpotlightKid/jack-matchmaker for more examples.
 """
 
 import argparse
+import errno
+import json
 import logging
-import queue
+import random
 import re
 import signal
 import sys
 import time
 
-from collections import defaultdict
 from itertools import chain
 
-from cachetools import cached, TTLCache
-
-import jacklib
-from jacklib.helpers import c_char_p_p_to_list, get_jack_status_error_string
-
+try:
+    import jacklib
+    from jacklib.helpers import c_char_p_p_to_list, get_jack_status_error_string
+except ImportError as exc:
+    # Without libjack, only the offline plan mode is available
+    jacklib = None
+    JACKLIB_ERROR = str(exc)
+
+from .control import ControlError, ControlServer, default_control_socket, send_request
+from .events import (CONTROL_REQUEST, DUMP_METRICS, DUMP_TRACE, EVENT_QUEUE_MAXSIZE,
+                     PATTERNS_CHANGED, PORT_CONNECTED, PORT_REGISTERED, PORT_RENAMED,
+                     PROPERTY_CHANGED, SHUTDOWN, Event, EventQueue, PortChanges)
+from .graph import PORT_IS_INPUT, PORT_IS_OUTPUT, Graph, Port
+from .listing import (FORMATS as LISTING_FORMATS, ListingWriter, compile_filters,
+                      filter_connections)
+from .loop import EventLoop
+from .matcher import Matcher
+from .metrics import CallCounter, Metrics, MetricsServer, unix_sockets_supported
+from .patterns import (TEMPLATE_CACHE_MAXSIZE, PatternIndex, compile_output_pattern, compile_pair,
+                       match_pattern, pair_source, read_pattern_file)
+from .plan import run_plan
+from .reconciler import Reconciler
+from .scheduler import DEFAULT_CONNECT_RETRIES, ConnectionScheduler
+from .snapshot import graph_snapshot
+from .trace import DEFAULT_TRACE_SIZE, MatchTracer, format_record
+from .watcher import DEFAULT_POLL_INTERVAL, FileWatcher
 from .version import __version__
 
 
 __program__ = "jack-matchmaker"
+# Property change types (same values as jacklib.PropertyCreated etc.)
 PROPERTY_CHANGE_MAP = {
-    jacklib.PropertyCreated: 'created',
-    jacklib.PropertyChanged: 'changed',
-    jacklib.PropertyDeleted: 'deleted'
+    0: 'created',
+    1: 'changed',
+    2: 'deleted'
 }
-PORT_CACHE_MAXSIZE = 10
-PORT_CACHE_TTL = 10
-CONNECTION_CACHE_MAXSIZE = 1024
-CONNECTION_CACHE_TTL = 10
+DEFAULT_CONNECT_INTERVAL = 3.0
+DEFAULT_CONNECT_MIN_INTERVAL = 0.1
+DEFAULT_DEBOUNCE = 50
+DEFAULT_METRICS_INTERVAL = 10.0
 log = logging.getLogger(__program__)
 
 
@@ -89,16 +124,69 @@ def posnum(arg):
     return value
 
 
+def posfloat(arg):
+    """Make sure that command line arg is a number greater than zero."""
+    value = float(arg)
+    if value <= 0:
+        raise argparse.ArgumentTypeError("Value must be greater than zero!")
+    return value
+
+
+def nonnegint(arg):
+    """Make sure that command line arg is an integer greater than or equal to zero."""
+    value = int(arg)
+    if value < 0:
+        raise argparse.ArgumentTypeError("Value must not be negative!")
+    return value
+
+
+def posint(arg):
+    """Make sure that command line arg is an integer greater than zero."""
+    value = int(arg)
+    if value < 1:
+        raise argparse.ArgumentTypeError("Value must be greater than zero!")
+    return value
+
+
 class JackMatchmaker(object):
     def __init__(self, patterns, pattern_file=None, name=__program__, exact_matching=False,
-                 connect_interval=3.0, connect_max_attempts=0):
-        self.patterns = []
+                 connect_interval=DEFAULT_CONNECT_INTERVAL, connect_max_attempts=0,
+                 debounce=DEFAULT_DEBOUNCE / 1000, event_queue_size=EVENT_QUEUE_MAXSIZE,
+                 template_cache_size=TEMPLATE_CACHE_MAXSIZE, metrics_file=None,
+                 metrics_interval=DEFAULT_METRICS_INTERVAL, metrics_socket=None,
+                 control_socket=None, watch_pattern_file=False,
+                 watch_interval=DEFAULT_POLL_INTERVAL, match_aliases=True,
+                 connect_min_interval=DEFAULT_CONNECT_MIN_INTERVAL, connect_rate=0,
+                 connect_window=0, connect_retries=DEFAULT_CONNECT_RETRIES, unmirror=False,
+                 trace_size=0, trace_sample=1):
+        if jacklib is None:
+            raise RuntimeError("JACK is not available: %s" % JACKLIB_ERROR)
+
+        self.patterns = PatternIndex(exact_matching, template_cache_size)
         self.pattern_file = pattern_file
         self.client_name = name
         self.exact_matching = exact_matching
+        self.match_aliases = match_aliases
+        self.unmirror = unmirror
         self.connect_max_attempts = connect_max_attempts
         self.connect_interval = connect_interval
+        self.connect_min_interval = connect_min_interval
+        self.debounce = debounce
         self.default_encoding = jacklib.ENCODING
+        self.metrics = Metrics()
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        self.metrics_server = None
+        self.control_server = None
+        self.watcher = None
+        self.loop = EventLoop()
+        self._process_timer = None
+        # (output pattern, input pattern) as read from pattern file -> compiled pattern pair
+        self._file_pairs = {}
+        # compiled pattern pairs given on the command line or added via the control socket
+        self._other_pairs = set()
+        # Proxy for jacklib counting calls to its functions
+        self.jack = CallCounter(jacklib, self.metrics, 'jack_calls_total')
 
         jacklib.set_error_function(self.error_callback)
 
@@ -111,104 +199,548 @@ class JackMatchmaker(object):
 
             if not sys.platform.startswith('win'):
                 signal.signal(signal.SIGHUP, self.reread_pattern_file)
-            else:
+            elif not watch_pattern_file:
                 log.warning("Signal handling not supported on Windows. jack-matchmaker must be "
                             "restarted to re-read the pattern file.")
 
+            if watch_pattern_file:
+                self.watcher = FileWatcher(self.pattern_file, self.pattern_file_changed,
+                                           watch_interval)
+
+        if not sys.platform.startswith('win'):
+            signal.signal(signal.SIGUSR1, self.dump_metrics)
+            signal.signal(signal.SIGUSR2, self.dump_trace)
+
         for pair in patterns:
             self.add_patterns(*pair)
 
-        self.connection_cache = TTLCache(maxsize=CONNECTION_CACHE_MAXSIZE, ttl=CONNECTION_CACHE_TTL)
-        self.queue = queue.Queue()
+        self.patterns.build()
+
+        self.events = EventQueue(event_queue_size)
+        self.changes = PortChanges()
+        self.graph = Graph()
+        self.tracer = MatchTracer(trace_size, trace_sample) if trace_size else None
+        self.matcher = Matcher(self.patterns, self.graph, tracer=self.tracer)
+        self.reconciler = Reconciler(self.graph)
+        self.scheduler = ConnectionScheduler(self.loop, self._connect_ports, connect_rate,
+                                             connect_window, connect_retries,
+                                             metrics=self.metrics)
+        # connections made by other clients since last refresh
+        self._new_connections = []
+        # connections removed since last refresh, if mirrored connections are removed as well
+        self._removed_connections = []
+        # whether graph must be re-loaded from server
+        self._graph_stale = False
+        # connections desired when the server shut down, to be re-made when it is back
+        self._cached_plan = None
+        # pattern generation, for which pretty names of all matchable ports were retrieved
+        self._pretty_names_generation = None
+        self._event_handlers = {
+            PORT_REGISTERED: self._handle_registration,
+            PORT_RENAMED: self._handle_rename,
+            PORT_CONNECTED: self._handle_connection,
+            PROPERTY_CHANGED: self._handle_property_change,
+            PATTERNS_CHANGED: self._handle_patterns_change,
+            DUMP_METRICS: self._handle_dump_metrics,
+            DUMP_TRACE: self._handle_dump_trace,
+            CONTROL_REQUEST: self._handle_control_request,
+        }
         self.client = None
+        self._connect_error = "Could not connect to JACK server."
+        self._register_metrics()
+
+        if metrics_socket:
+            if unix_sockets_supported():
+                self.metrics_server = MetricsServer(metrics_socket, self.metrics)
+            else:
+                log.warning("UNIX domain sockets not supported on this platform. "
+                            "Metrics socket not created.")
+
+        if control_socket:
+            if unix_sockets_supported():
+                self.control_server = ControlServer(
+                    control_socket, lambda request: self.events.put(Event(CONTROL_REQUEST,
+                                                                          request)))
+            else:
+                log.warning("UNIX domain sockets not supported on this platform. "
+                            "Control socket not created.")
+
+    def _register_metrics(self):
+        metrics = self.metrics
+        templates = self.patterns.templates
+        metrics.counter('events_total', "JACK notifications and other events processed by type.")
+        metrics.counter('events_dropped_total', "Events rejected because the event queue was full.",
+                        lambda: self.events.overflows)
+        metrics.gauge('event_queue_depth', "Number of events in the event queue.",
+                      lambda: len(self.events))
+        metrics.gauge('event_queue_peak', "Highest number of events in the event queue.",
+                      lambda: self.events.peak)
+        metrics.counter('loop_wakeups_total', "Number of times the main loop woke up.",
+                        lambda: self.loop.wakeups)
+        metrics.histogram('refresh_seconds', "Duration of matching ports against patterns.")
+        metrics.histogram('event_to_connect_seconds',
+                          "Latency from first event of a batch to connections being made.")
+        metrics.counter('connects_total', "Attempts to connect ports by result.")
+        metrics.counter('disconnects_total', "Attempts to remove mirrored connections by result.")
+        metrics.counter('connect_retries_total', "Retries of failed attempts to connect ports.")
+        metrics.gauge('connect_queue_depth', "Number of connections waiting to be made.",
+                      lambda: len(self.scheduler))
+        metrics.histogram('connect_queue_seconds',
+                          "Time connections waited in the queue before being made.")
+        metrics.counter('jack_calls_total', "Calls to jacklib functions by function name.")
+        metrics.counter('template_cache_hits_total', "Input port pattern template cache hits.",
+                        lambda: templates.hits)
+        metrics.counter('template_cache_misses_total',
+                        "Input port pattern template cache misses.", lambda: templates.misses)
+        metrics.gauge('template_cache_entries', "Entries in input port pattern template cache.",
+                      lambda: templates.currsize)
+        metrics.counter('unmatched_cache_hits_total',
+                        "Ports skipped because they are known to match no source pattern.",
+                        lambda: self.matcher.unmatched_hits)
+        metrics.gauge('unmatched_cache_entries', "Ports known to match no source pattern.",
+                      lambda: len(self.matcher.unmatched))
+        metrics.gauge('pattern_pairs', "Number of pattern pairs.", lambda: len(self.patterns))
+        metrics.gauge('ports', "Number of ports in the port graph.", lambda: len(self.graph))
+        metrics.gauge('matched_pairs', "Number of matched port pairs.",
+                      lambda: sum(len(dsts) for dsts in self.reconciler.matches.values()))
 
     def connect(self, max_attempts=None):
+        """Connect to the JACK server, blocking until connected or ``max_attempts`` failed.
+
+        Only used when not running the main loop, which schedules re-connection attempts with a
+        timer instead.
+
+        """
         if max_attempts is None:
             max_attempts = self.connect_max_attempts
 
-        tries = 0
-        while True:
-            log.debug("Attempting to connect to JACK server...")
-            status = jacklib.jack_status_t()
-            self.client = jacklib.client_open(self.client_name, jacklib.JackNoStartServer, status)
+        tries = 1
+        while not self._open_client(tries):
+            if max_attempts and tries >= max_attempts:
+                log.error("Maximum number (%i) of connection attempts reached. Aborting.",
+                          max_attempts)
+                raise RuntimeError(self._connect_error)
+
+            delay = self._connect_delay(tries)
+            log.debug("Waiting %.2f seconds to connect again...", delay)
+            time.sleep(delay)
             tries += 1
 
-            if status.value:
-                err = get_jack_status_error_string(status)
-                if status.value & jacklib.JackNameNotUnique:
-                    log.debug(err)
-                elif status.value & jacklib.JackServerStarted:
-                    # Should not happen, since we use the JackNoStartServer option
-                    log.warning("Unexpected JACK status: %s", err)
-                else:
-                    log.warning("JACK connection error (attempt %i): %s", tries, err)
+    def _connect_delay(self, tries):
+        """Return delay before the next attempt to connect after ``tries`` failed attempts.
 
-            if self.client:
-                break
+        The delay starts at ``connect_min_interval`` and doubles with each failed attempt up to
+        ``connect_interval``. A random jitter of up to half of the delay is subtracted, so that
+        several clients do not all retry at the same time.
 
-            if max_attempts and tries >= max_attempts:
-                log.error("Maximum number (%i) of connection attempts reached. Aborting.",
-                          max_attempts)
-                raise RuntimeError(err)
+        """
+        delay = min(self.connect_interval, self.connect_min_interval * 2 ** min(tries - 1, 32))
+        return delay - random.uniform(0, delay / 2)
+
+    def _open_client(self, tries=1):
+        """Try once to open a JACK client. Returns whether that succeeded."""
+        log.debug("Attempting to connect to JACK server...")
+        status = jacklib.jack_status_t()
+        self.client = self.jack.client_open(self.client_name, jacklib.JackNoStartServer, status)
+
+        if status.value:
+            err = self._connect_error = get_jack_status_error_string(status)
+            if status.value & jacklib.JackNameNotUnique:
+                log.debug(err)
+            elif status.value & jacklib.JackServerStarted:
+                # Should not happen, since we use the JackNoStartServer option
+                log.warning("Unexpected JACK status: %s", err)
+            else:
+                log.warning("JACK connection error (attempt %i): %s", tries, err)
 
-            log.debug("Waiting %.2f seconds to connect again...", self.connect_interval)
-            time.sleep(self.connect_interval)
+        if not self.client:
+            return False
 
-        name = jacklib.get_client_name(self.client)
+        name = self.jack.get_client_name(self.client)
         if name is not None:
             self.client_name = name.decode()
         else:
             raise RuntimeError("Could not get JACK client name.")
 
-        jacklib.on_shutdown(self.client, self.shutdown_callback, None)
+        self.jack.on_shutdown(self.client, self.shutdown_callback, None)
         log.debug("Client connected, name: %s UUID: %s", self.client_name,
-                  jacklib.client_get_uuid(self.client))
+                  self.jack.client_get_uuid(self.client))
+        return True
 
     def close(self):
+        result = None
+
         if self.client:
-            jacklib.deactivate(self.client)
-            return jacklib.client_close(self.client)
+            self.jack.deactivate(self.client)
+            result = self.jack.client_close(self.client)
+
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+
+        for server in (self.metrics_server, self.control_server):
+            if server is not None:
+                server.server_close()
+
+        self.metrics_server = self.control_server = None
+        self.scheduler.clear()
+        self.loop.close()
+        self.events.close()
+        return result
+
+    def compile_output_pattern(self, ptn_output):
+        """Return output port pattern compiled into a regex (unless it is literal).
+
+        Raises ``re.error`` if the pattern is not a valid regular expression.
+
+        """
+        return compile_output_pattern(ptn_output, self.exact_matching)
+
+    def compile_pair(self, ptn_output, ptn_input):
+        """Return ``PatternPair`` with compiled output port pattern and port filters.
+
+        Raises ``re.error`` if the output port pattern is not a valid regular expression.
+
+        """
+        return compile_pair(ptn_output, ptn_input, self.exact_matching)
+
+    def _compile_pair(self, ptn_output, ptn_input):
+        try:
+            return self.compile_pair(ptn_output, ptn_input)
+        except re.error as exc:
+            log.error("Error in output port pattern '%s': %s", ptn_output, exc)
+            return None
 
     def add_patterns(self, ptn_output, ptn_input):
-        if not self.exact_matching or (ptn_output.startswith('/') and ptn_output.endswith('/')):
-            try:
-                ptn_output = re.compile(ptn_output.strip('/'))
-            except re.error as exc:
-                log.error("Error in output port pattern '%s': %s", ptn_output, exc)
-                return
+        """Add pattern pair, which is kept when the pattern file is re-read."""
+        pair = self._compile_pair(ptn_output, ptn_input)
+
+        if pair is not None:
+            self._other_pairs.add(pair)
 
-        if not (ptn_output, ptn_input) in self.patterns:
-            pattern = ptn_output.pattern if isinstance(ptn_output, re.Pattern) else ptn_output
-            log.debug("Added patterns: '%s' --> '%s'", pattern, ptn_input)
-            self.patterns.append((ptn_output, ptn_input))
+            if self.patterns.add(*pair):
+                log.debug("Added patterns: '%s' --> '%s'", ptn_output, ptn_input)
 
     def add_patterns_from_file(self, filename):
-        with open(filename) as fp:
-            stripfilter = (line.strip() for line in fp)
-            linefilter = (line for line in stripfilter if line and not line.startswith('#'))
+        """Read pattern pairs from file, replacing the pairs read from a pattern file before.
 
-            for ptn_output, ptn_input in pairwise(linefilter):
-                self.add_patterns(ptn_output, ptn_input)
+        Only pairs, which were added to or removed from the file, are compiled resp. removed.
+        Pairs given on the command line or added via the control socket are kept, even if they
+        were removed from the file.
+
+        Returns a list of the added and removed pattern pairs.
+
+        """
+        old_pairs, new_pairs = self._file_pairs, {}
+
+        for ptns in read_pattern_file(filename):
+            if ptns not in new_pairs:
+                pair = old_pairs.get(ptns) or self._compile_pair(*ptns)
+
+                if pair is not None:
+                    new_pairs[ptns] = pair
+
+        self._file_pairs = new_pairs
+        kept = set(new_pairs.values()) | self._other_pairs
+        changed = []
+
+        for ptns, pair in old_pairs.items():
+            if pair not in kept and self.patterns.remove(*pair):
+                log.debug("Removed patterns: '%s' --> '%s'", *ptns)
+                changed.append(pair)
+
+        for ptns, pair in new_pairs.items():
+            if self.patterns.add(*pair):
+                log.debug("Added patterns: '%s' --> '%s'", *ptns)
+                changed.append(pair)
+
+        if changed:
+            self.patterns.build()
+
+        return changed
 
     def reread_pattern_file(self, sig_no, frame):
         log.debug("HUP signal received. Re-reading patterns from '%s'.", self.pattern_file)
-        self.patterns = []
+        self.events.put(Event(PATTERNS_CHANGED))
+
+    def pattern_file_changed(self):
+        log.debug("Pattern file '%s' changed. Re-reading patterns.", self.pattern_file)
+        self.events.put(Event(PATTERNS_CHANGED))
+
+    def dump_metrics(self, sig_no, frame):
+        self.events.put(Event(DUMP_METRICS))
+
+    def dump_trace(self, sig_no, frame):
+        self.events.put(Event(DUMP_TRACE))
+
+    # JACK notification callbacks. These are called from the JACK notification thread and only
+    # put an event on the event queue, which is processed by the main loop in ``run``.
+
+    def property_callback(self, subject, name, type_, *args):
+        self.events.put(Event(PROPERTY_CHANGED, subject, name, type_, time.monotonic()))
+
+    def rename_callback(self, port_id, old_name, new_name, *args):
+        self.events.put(Event(PORT_RENAMED, port_id, old_name, new_name, time.monotonic()))
+
+    def connect_callback(self, port_a_id, port_b_id, connect, *args):
+        self.events.put(Event(PORT_CONNECTED, port_a_id, port_b_id, connect, time.monotonic()))
+
+    def reg_callback(self, port_id, action, *args):
+        self.events.put(Event(PORT_REGISTERED, port_id, action, None, time.monotonic()))
+
+    def shutdown_callback(self, *args):
+        """If JACK server signals shutdown, put a ``SHUTDOWN`` event on the event queue.
+
+        This causes the client to reconnect.
+
+        """
+        self.events.put(Event(SHUTDOWN))
+
+    def error_callback(self, error):
+        error = error.decode(self.default_encoding, errors='ignore')
+        log.debug(error)
+
+    # Event handlers. These are called from the main loop in ``run``.
+
+    def _events_pending(self):
+        """Schedule processing of queued events after the debounce interval.
+
+        Called by the main loop, when the event queue signals that events are pending. Events
+        arriving within the debounce interval after the first one are processed together.
+
+        """
+        self.events.clear_wakeup()
+
+        if self._process_timer is None:
+            self._process_timer = self.loop.call_later(self.debounce, self._process_pending)
+
+    def _process_pending(self):
+        self._process_timer = None
+
+        if not self._process_events():
+            self._attempt_connect()
+
+    def _process_events(self):
+        """Process all queued events, evaluate resulting port changes and make connections.
+
+        Returns ``False`` if the JACK server shut down, ``True`` otherwise.
+
+        """
+        events = self.events.get_all()
+        shutdown = False
+
+        if self.events.overflowed:
+            self.events.reset()
+            log.warning("Event queue overflow (%i events dropped in total). Re-scanning all "
+                        "ports.", self.events.overflows)
+            self._graph_stale = True
+            events = [event for event in events if event.type in EventQueue.CONTROL_EVENTS]
+
+        for event in events:
+            if event.type == SHUTDOWN:
+                if self.client is not None:
+                    self._handle_shutdown()
+
+                shutdown = True
+                continue
+
+            if shutdown and event.type not in EventQueue.CONTROL_EVENTS:
+                # Stale notification from before shutdown
+                continue
+
+            self.metrics.inc('events_total', labels=(('type', event.type),))
+            self._event_handlers[event.type](*event[1:4])
+
+        if self.client is None:
+            # Port changes are evaluated by the full refresh after (re-)connecting.
+            return not shutdown
+
+        if self._graph_stale:
+            self._graph_stale = False
+            self.load_graph()
+            self.changes.mark_full_refresh()
+
+        if self.changes or self._new_connections:
+            pairs = self._refresh()
+
+            if pairs is not None:
+                # Mirror new connections to input ports, which are sources of matched pairs.
+                pairs.extend(self.reconciler.mirrored(self._new_connections))
+
+            self._new_connections = []
+
+            if self._reconcile(pairs):
+                times = [event.time for event in events if event.time is not None]
+
+                if times:
+                    self.metrics.observe('event_to_connect_seconds', time.monotonic() - min(times))
+
+        if self._removed_connections:
+            self._unmirror(self.reconciler.unmirrored(self._removed_connections))
+            self._removed_connections = []
+
+        return True
+
+    def _handle_shutdown(self):
+        """Forget client and all state only valid while connected to the same server.
+
+        The pattern index and the last known port graph are kept. The connections desired for
+        the matched port pairs in the graph are cached, so they can be made again as soon as the
+        server is back (see ``_restore_connections``).
+
+        """
+        log.debug("JACK server signalled shutdown.")
+        self.client = None
+        self._cached_plan = list({conn: None for conn in self.reconciler.desired()})
+        self.graph.clear_ids()
+        self.reconciler.pending.clear()
+        self.reconciler.mirrors.clear()
+        self.scheduler.clear()
+        self._new_connections = []
+        self._removed_connections = []
+
+    def _restore_connections(self):
+        """Make connections cached when the server shut down.
+
+        This is done right after activating the client, before the port graph is loaded and
+        matched against the patterns, so ports, which are back already, are connected again as
+        fast as possible. Connections to ports, which do not exist (yet), fail silently. The full
+        refresh after loading the graph verifies all connections.
+
+        """
+        plan, self._cached_plan = self._cached_plan, None
+
+        if not plan:
+            return
+
+        start = time.perf_counter()
+        made = sum(1 for outport, inport in plan
+                   if self.jack.connect(self.client, outport, inport) == 0)
+        self.metrics.inc('connects_total', made, (('result', 'restored'),))
+        log.info("Restored %i of %i connection(s) from before server shutdown in %.1f ms.",
+                 made, len(plan), (time.perf_counter() - start) * 1000)
+
+    def _handle_dump_metrics(self, *args):
+        log.info("Metrics:\n%s", self.metrics.render())
+
+    def _handle_dump_trace(self, *args):
+        if self.tracer is None:
+            log.warning("Match tracing is not enabled.")
+            return
+
+        log.info("Match trace (%i of %i decisions):\n%s", len(self.tracer), self.tracer.total,
+                 "\n".join(format_record(record) for record in self.tracer.dump()))
+
+    def _handle_control_request(self, request, *args):
+        if request.command == 'snapshot':
+            # The graph model lacks the aliases and pretty names of ports, which are not needed
+            # for matching, so the snapshot is taken from a freshly retrieved graph.
+            graph = self.graph if self.client is None else self._read_graph(True, True)
+            request.reply(ok=True, snapshot=graph_snapshot(graph))
+            return
+
+        if request.command == 'trace':
+            if self.tracer is None:
+                request.reply(ok=False, error="Match tracing is not enabled.")
+            else:
+                request.reply(ok=True, trace=self.tracer.dump())
+
+            return
+
+        if request.command == 'list':
+            request.reply(ok=True, pairs=[list(pair_source(pair, self.exact_matching))
+                                          for pair in self.patterns])
+            return
 
         try:
-            self.add_patterns_from_file(self.pattern_file)
+            pairs = [self.compile_pair(ptn_output, ptn_input)
+                     for ptn_output, ptn_input in request.pairs]
+        except re.error as exc:
+            request.reply(ok=False, error="Error in output port pattern: %s" % exc)
+            return
+
+        if request.command == 'add':
+            self._other_pairs.update(pairs)
+            changed = [pair for pair in pairs if self.patterns.add(*pair)]
+        else:
+            self._other_pairs.difference_update(pairs)
+            changed = [pair for pair in pairs if self.patterns.remove(*pair)]
+
+        for pair in changed:
+            log.info("%s patterns via control socket: '%s' --> '%s'",
+                     "Added" if request.command == 'add' else "Removed",
+                     *pair_source(pair, self.exact_matching))
+
+        self._mark_sources(changed)
+        request.reply(ok=True, changed=len(changed))
+
+    def _mark_sources(self, pairs):
+        """Mark all ports matched by the output port pattern of any of the given pairs.
+
+        This causes only these ports to be matched against the pattern pairs again, e.g. after
+        pairs were added or removed.
+
+        The cache of ports matching no source pattern is kept, except for the marked ports,
+        since ports not matched by any of the pairs are not affected by adding or removing them.
+
+        """
+        sources = {(pair.output, pair.source_filter) for pair in pairs}
+
+        if not sources:
+            return
+
+        # Ports of clients, which could not be matched before, have no pretty names yet
+        self._load_pretty_names(self.graph)
+        self._pretty_names_generation = self.patterns.generation
+        marked = []
+
+        for port in self.graph:
+            if any((port_filter is None or port_filter.matches(port))
+                   and any(match_pattern(ptn_output, name) for name in port.names())
+                   for ptn_output, port_filter in sources):
+                self.changes.mark_port(port.name, as_destination=False)
+                marked.append(port.name)
+
+        self.matcher.keep_unmatched(marked)
+
+    def _write_metrics(self):
+        self.loop.call_later(self.metrics_interval, self._write_metrics)
+
+        try:
+            self.metrics.write(self.metrics_file)
+        except OSError as exc:
+            log.error("Could not write metrics file '%s': %s", self.metrics_file, exc)
+
+    def _handle_patterns_change(self, *args):
+        try:
+            changed = self.add_patterns_from_file(self.pattern_file)
         except OSError as exc:
             log.error("Could not read pattern file '%s': %s", self.pattern_file, exc)
         else:
-            self._refresh()
+            log.info("Re-read pattern file '%s' (%i pattern pairs added or removed).",
+                     self.pattern_file, len(changed))
+            self._mark_sources(changed)
 
-    def property_callback(self, subject, name, type_, *args):
+    def _handle_property_change(self, subject, name, type_):
         if name:
             name = name.decode(self.default_encoding, errors='ignore')
 
         log.debug("Property '%s' on subject %s %s.", name, subject, PROPERTY_CHANGE_MAP[type_])
-        self._refresh()
 
-    def rename_callback(self, port_id, old_name, new_name, *args):
+        if name and name != jacklib.JACK_METADATA_PRETTY_NAME:
+            return
+
+        port = self.graph.by_uuid.get(subject)
+
+        if port is not None:
+            # Retrieved again when needed, i.e. when port is matched against the patterns.
+            port.pretty_name = None
+            self.matcher.invalidate(port.name)
+
+            if self.patterns.could_match_client(port.client):
+                self.changes.mark_port(port.name)
+
+    def _handle_rename(self, port_id, old_name, new_name):
         if old_name:
             old_name = old_name.decode(self.default_encoding, errors='ignore')
 
@@ -216,231 +748,493 @@ class JackMatchmaker(object):
             new_name = new_name.decode(self.default_encoding, errors='ignore')
 
         log.debug("Port name %s changed to %s.", old_name, new_name)
-        self._refresh()
+        port = self.graph.by_id.get(port_id) or self.graph.get(old_name)
+
+        if port is None or not new_name:
+            return
+
+        old_name = port.name
+        self.graph.rename(old_name, new_name)
+        self.reconciler.rename_port(old_name, new_name)
+        self.matcher.invalidate(old_name)
+        self.matcher.invalidate(new_name)
+        self.graph.set_id(port, port_id)
+        self.changes.forget_port(old_name)
+        self.changes.mark_port(new_name)
+
+    def _handle_connection(self, port_a_id, port_b_id, connect):
+        port_a = self._get_port_by_id(port_a_id)
+        port_b = self._get_port_by_id(port_b_id)
+
+        if port_a is None or port_b is None:
+            return
+
+        if port_a.is_input:
+            port_a, port_b = port_b, port_a
 
-    def connect_callback(self, port_a_id, port_b_id, connect, *args):
         if connect == 0:
+            log.debug("Port connection removed: '%s' -> '%s'", port_a.name, port_b.name)
+            self.graph.disconnect(port_a.name, port_b.name)
+            self.reconciler.confirm(port_a.name, port_b.name)
+            self.reconciler.mirrors.discard((port_a.name, port_b.name))
+
+            if self.unmirror and port_b.name in self.reconciler.matches:
+                self._removed_connections.append((port_a.name, port_b.name))
+
             return
 
-        port_a = jacklib.port_by_id(self.client, port_a_id)
-        port_b = jacklib.port_by_id(self.client, port_b_id)
-        port_a_name = jacklib.port_name(port_a)
-        port_b_name = jacklib.port_name(port_b)
-        log.debug("New port connection: '%s' -> '%s'", port_a_name, port_b_name)
+        self.graph.connect(port_a.name, port_b.name)
 
-        if self.connection_cache.pop((port_a_name, port_b_name), False):
-            log.debug("Connection in cache. Skipping refresh.")
+        if self.reconciler.confirm(port_a.name, port_b.name):
+            log.debug("Own port connection confirmed: '%s' -> '%s'", port_a.name, port_b.name)
         else:
-            self._refresh()
+            log.debug("New port connection: '%s' -> '%s'", port_a.name, port_b.name)
+            self._new_connections.append((port_a.name, port_b.name))
 
-    def reg_callback(self, port_id, action, *args):
+    def _handle_registration(self, port_id, action, *args):
         if action == 0:
+            port = self._get_port_by_id(port_id)
+
+            if port is not None:
+                log.debug("Port unregistered: %s", port.name)
+                self.graph.remove(port.name)
+                self.matcher.invalidate(port.name)
+                self.reconciler.forget_mirrors(port.name)
+                self.reconciler.forget_pending(port.name)
+                self.changes.forget_port(port.name)
+            else:
+                log.debug("Unregistered port with ID %i unknown. Re-loading graph.", port_id)
+                self._graph_stale = True
+
             return
 
-        port = jacklib.port_by_id(self.client, port_id)
-        log.debug("New port registered: %s", jacklib.port_name(port))
-        self._refresh()
+        handle = self.jack.port_by_id(self.client, port_id)
+        port = self._load_port(self.jack.port_name(handle), handle) if handle else None
 
-    def error_callback(self, error):
-        error = error.decode(self.default_encoding, errors='ignore')
-        log.debug(error)
+        if port is not None:
+            log.debug("New port registered: %s", port.name)
+            port.id = port_id
+            self.graph.add(port)
+            self.changes.mark_port(port.name)
 
-    def _refresh(self):
-        inputs = list(flatten(self.get_ports(jacklib.JackPortIsInput)))
-        outputs = list(flatten(self.get_ports(jacklib.JackPortIsOutput)))
-
-        for ptn_output, ptn_input in self.patterns:
-            for output in chain(outputs, inputs):
-                if isinstance(output, tuple):
-                    real_output, output = output
-                else:
-                    real_output = None
-
-                if isinstance(ptn_output, re.Pattern):
-                    log.debug("Match regex '%s' on source port '%s'.", ptn_output.pattern, output)
-                    match_output = ptn_output.match(output)
-                else:
-                    match_output = ptn_output == output
-
-                if match_output:
-                    log.debug("Found matching source port: %s", output)
-
-                    if isinstance(match_output, re.Match):
-                        # try to fill-in groups matches from output port
-                        # pattern into input port pattern
-                        try:
-                            subst = defaultdict(str, **match_output.groupdict())
-                            ptn_input_xformed = ptn_input.format_map(subst)
-                        except Exception as exc:
-                            log.warn("Could not merge match groups into input pattern '%s': %s",
-                                     ptn_input, exc)
-                            ptn_input_xformed = ptn_input
-                    else:
-                        ptn_input_xformed = ptn_input
-
-                    if not self.exact_matching or (ptn_input_xformed.startswith('/')
-                                                   and ptn_input_xformed.endswith('/')):
-                        try:
-                            ptn_input_xformed = re.compile(ptn_input_xformed.strip('/'))
-                        except re.error as exc:
-                            log.error("Error in input port pattern '%s': %s",
-                                      ptn_input_xformed, exc)
-                            continue
-
-                    for input in inputs:
-                        if isinstance(input, tuple):
-                            real_input, input = input
-                        else:
-                            real_input = None
-
-                        if isinstance(ptn_input_xformed, re.Pattern):
-                            log.debug("Match regex '%s' on input port '%s'.",
-                                      ptn_input_xformed.pattern, input)
-                            match_input = ptn_input_xformed.match(input)
-                        else:
-                            match_input = ptn_input_xformed == input
-
-                        if match_input:
-                            log.debug("Found matching input port: %s", input)
-                            self.queue.put((real_output or output, real_input or input))
+    def _refresh(self, full=False):
+        """Match pattern pairs against all ports changed since the last refresh.
+
+        If ``full`` is true, all ports currently registered are matched against all pattern
+        pairs. This full re-scan of the JACK port graph is only done at startup and when the
+        patterns are reloaded.
+
+        The resulting matched port pairs are added to the reconciler. Returns a list of the
+        new pairs or ``None`` after a full re-scan.
 
-    def shutdown_callback(self, *args):
         """
-        If JACK server signals shutdown, sent ``None`` to the queue to cause client to reconnect.
+        start = time.perf_counter()
+        full_refresh, changed_ports = self.changes.pop()
+        pairs = {}
+
+        if full or full_refresh or self._pretty_names_generation != self.patterns.generation:
+            self._load_pretty_names(self.graph)
+            self._pretty_names_generation = self.patterns.generation
+        else:
+            self._load_pretty_names(self.graph.get(port_name) for port_name, action in
+                                    changed_ports.items() if action != PortChanges.FORGET)
+
+        if full or full_refresh:
+            self.reconciler.clear()
+
+            for src, dst in self.matcher.match_all():
+                self.reconciler.add(src, dst)
+
+            templates = self.patterns.templates
+            log.debug("Input port pattern cache: %i hits, %i misses, %i/%i entries.",
+                      templates.hits, templates.misses, templates.currsize, templates.maxsize)
+            self.metrics.observe('refresh_seconds', time.perf_counter() - start,
+                                 (('kind', 'full'),))
+            return None
+
+        for port_name, action in changed_ports.items():
+            if action == PortChanges.FORGET:
+                self._forget_port(port_name)
+            else:
+                for src, dst in self._refresh_port(port_name, *action):
+                    if self.reconciler.add(src, dst):
+                        pairs[(src, dst)] = None
+
+        self.metrics.observe('refresh_seconds', time.perf_counter() - start,
+                             (('kind', 'incremental'),))
+        return list(pairs)
+
+    def _refresh_port(self, port_name, as_source=True, as_destination=True):
+        """Match a single new or changed port against the pattern pairs.
+
+        The port is matched as a source against the first pattern of each pair, and, if it is an
+        input port, as a destination against the input port patterns already resolved for all
+        matching source ports. Yields the resulting new port pairs.
+
         """
-        log.debug("JACK server signalled shutdown.")
-        self.client = None
-        self.queue.put(None)
+        port = self.graph.get(port_name)
+
+        if port is None:
+            log.debug("Port vanished: %s", port_name)
+            return
+
+        if as_source:
+            self.matcher.forget(port_name)
+            self.reconciler.forget(port_name, as_destination=False)
+            yield from self.matcher.match_source(port)
+
+        if as_destination and port.is_input:
+            self.reconciler.forget(port_name, as_source=False)
+            yield from self.matcher.match_destination(port)
+
+    def _load_pretty_names(self, ports, all_ports=False):
+        """Retrieve pretty names of given ports, if not yet known.
+
+        Unless ``all_ports`` is true, only pretty names of ports of clients, whose ports could
+        be matched by the patterns, are retrieved. If there are several, they are retrieved with
+        a single meta data query.
+
+        """
+        could_match_client = self.patterns.could_match_client
+        ports = [port for port in ports if port is not None and port.pretty_name is None
+                 and (all_ports or could_match_client(port.client))]
+
+        if len(ports) == 1:
+            prop = self.jack.get_property(ports[0].uuid, jacklib.JACK_METADATA_PRETTY_NAME)
+            ports[0].pretty_name = prop.value if prop and prop.value else ''
+        elif ports:
+            pretty_names = {}
+
+            for subject, props in self.jack.get_all_properties().items():
+                for prop in props:
+                    if prop.key == jacklib.JACK_METADATA_PRETTY_NAME:
+                        pretty_names[subject] = prop.value
+
+            for port in ports:
+                port.pretty_name = pretty_names.get(port.uuid) or ''
+
+    def _forget_port(self, port_name):
+        """Drop input port patterns resolved for and matched pairs with the given port."""
+        if port_name:
+            self.matcher.forget(port_name)
+            self.reconciler.forget(port_name)
+
+    def _get_port_by_id(self, port_id):
+        """Return port record for port ID.
+
+        The IDs of ports, which were already registered when the graph was loaded, are not
+        known. They are looked up from the server once, when they are first needed.
+
+        """
+        port = self.graph.by_id.get(port_id)
+
+        if port is None:
+            handle = self.jack.port_by_id(self.client, port_id)
+            port = self.graph.get(self.jack.port_name(handle)) if handle else None
+
+            if port is not None:
+                self.graph.set_id(port, port_id)
+
+        return port
 
-    @cached(cache=TTLCache(maxsize=PORT_CACHE_MAXSIZE, ttl=PORT_CACHE_TTL))
-    def _get_port(self, name):
-        return jacklib.port_by_name(self.client, name)
+    def _load_port(self, port_name, handle=None, aliases=None):
+        """Retrieve properties of named port from server and return new port record.
 
-    def _get_aliases(self, port_name):
-        port = self._get_port(port_name)
-        num_aliases, *aliases = jacklib.port_get_aliases(port)
-        return list(aliases[:num_aliases])
+        Aliases are only retrieved if ``aliases`` is true or, if it is ``None``, if patterns are
+        matched against aliases. The pretty name is retrieved later, when it is needed.
 
-    def get_ports(self, type_=jacklib.JackPortIsOutput, include_aliases=True,
-                  include_pretty_names=True):
-        for port_name in c_char_p_p_to_list(jacklib.get_ports(self.client, '', '', type_)):
-            ports = [port_name]
+        """
+        if handle is None:
+            handle = self.jack.port_by_name(self.client, port_name)
+
+            if not handle:
+                return None
+
+        if aliases or (aliases is None and self.match_aliases):
+            num_aliases, *aliases = self.jack.port_get_aliases(handle)
+            aliases = aliases[:num_aliases]
+        else:
+            aliases = None
+
+        return Port(
+            port_name,
+            flags=self.jack.port_flags(handle),
+            type=self.jack.port_type(handle),
+            aliases=aliases,
+            uuid=self.jack.port_uuid(handle)
+        )
+
+    def load_graph(self, aliases=None, pretty_names=False, connections=True):
+        """Retrieve all ports and connections from the server into a new graph model.
+
+        See ``_load_port`` for the meaning of ``aliases``. If ``pretty_names`` is true, the
+        pretty names of all ports are retrieved as well. If ``connections`` is false, the
+        connections are not retrieved (only for listing ports).
+
+        """
+        graph = self._read_graph(aliases, pretty_names, connections)
+        log.debug("Loaded graph with %i ports.", len(graph))
+        self.graph = self.matcher.graph = self.reconciler.graph = graph
+        # Ports may have been unregistered without the server reporting their connections
+        self.reconciler.pending = {conn for conn in self.reconciler.pending
+                                   if conn[0] in graph and conn[1] in graph}
+        return graph
 
-            if include_aliases:
-                aliases = self._get_aliases(port_name)
-                ports.extend(aliases)
+    def _read_graph(self, aliases=None, pretty_names=False, connections=True):
+        graph = Graph()
 
-            if include_pretty_names:
-                pretty_name = jacklib.get_port_pretty_name(self.client, port_name)
+        for port_name in c_char_p_p_to_list(self.jack.get_ports(self.client, '', '', 0)):
+            handle = self.jack.port_by_name(self.client, port_name)
 
-                if pretty_name:
-                    try:
-                        client, port = port_name.split(':', 1)
-                    except ValueError:
-                        pass
-                    else:
-                        pretty_name = client + ':' + pretty_name
+            if not handle:
+                continue
 
-                    ports.append((port_name, pretty_name))
+            port = self._load_port(port_name, handle, aliases)
+            graph.add(port)
 
-            yield ports
+            if connections and port.is_output and self.jack.port_connected(handle):
+                for other in self.jack.port_get_all_connections(self.client, handle):
+                    graph.connect(port_name, other)
+
+        if pretty_names:
+            self._load_pretty_names(graph, all_ports=True)
+
+        return graph
+
+    def get_ports(self, type_=PORT_IS_OUTPUT):
+        """Return list of port records with given flags."""
+        return [port for port in self.graph if port.flags & type_ == type_]
 
     def get_connections(self, ports=None):
+        """Yield ``(port, other)`` tuples of port names for all connections of given ports.
+
+        ``ports`` defaults to all output ports.
+
+        """
         if ports is None:
-            ports = (p[0] for p in self.get_ports())
+            ports = (port.name for port in self.get_ports())
 
         for port_name in ports:
-            port = jacklib.port_by_name(self.client, port_name)
-
-            if port and jacklib.port_connected(port):
-                for other in jacklib.port_get_all_connections(self.client, port):
-                    yield((port_name, other))
-
-    def list_connections(self, patterns):
-        for outport, inport in self.get_connections():
-            if patterns:
-                match = False
-                for ptn in patterns:
-                    flags = re.I if ptn.lower() == ptn else 0
-
-                    if re.search(ptn, outport, flags) or re.search(ptn, inport, flags):
-                        match = True
-                        break
-            else:
-                match = True
+            for other in self.graph.get_connections(port_name):
+                yield (port_name, other)
+
+    def list_connections(self, patterns=None, writer=None):
+        """Write connections of all output ports matching any of the given regex patterns.
+
+        See ``ListingWriter`` for the output format. Connections are written to standard output
+        in text format, if no writer is given.
+
+        """
+        self._write_listing(writer, 'write_connections',
+                            filter_connections(self.graph, compile_filters(patterns or ())))
+
+    def list_ports(self, type_=PORT_IS_OUTPUT, include_aliases=True,
+                   include_pretty_names=True, writer=None):
+        """Write ports with given flags (see ``list_connections`` for the output)."""
+        section = 'inputs' if type_ & PORT_IS_INPUT else 'outputs'
+        ports = (port for port in self.graph if port.flags & type_ == type_)
+        self._write_listing(writer, 'write_ports', ports, section, include_aliases,
+                            include_pretty_names)
+
+    def _write_listing(self, writer, method, *args):
+        own_writer = writer is None
+
+        if own_writer:
+            writer = ListingWriter(sys.stdout)
+
+        getattr(writer, method)(*args)
+
+        if own_writer:
+            writer.close()
+
+    def _reconcile(self, pairs=None):
+        """Queue all missing connections desired for given matched port pairs.
+
+        If ``pairs`` is ``None``, the connections for all matched port pairs are checked.
+
+        The connections are queued with the priority of the matched port pair they are desired
+        for and made by the connection scheduler, immediately, unless a batching window or rate
+        limit is set. Missing connections resulting from mirroring a connection to an input port,
+        which is the source of matched pairs, are queued when the connection is made.
+
+        Returns the number of connections made immediately.
+
+        """
+        self._submit(self.reconciler.missing(pairs))
+        return self.scheduler.flush()
+
+    def _submit(self, missing):
+        priority, submit = self.matcher.priority, self.scheduler.submit
+
+        for conn, pair in missing.items():
+            submit(conn, priority(*pair))
+
+    def _connect_ports(self, conn):
+        """Make connection queued by the connection scheduler.
+
+        Returns ``True`` if the connection was made or already existed, ``False`` if it failed and
+        ``None`` if it is not needed (anymore).
 
-            if match:
-                print("%s\n    %s\n" % (outport, inport))
+        """
+        outport, inport = conn
+
+        if (self.client is None or outport not in self.graph or inport not in self.graph
+                or conn in self.reconciler.pending or self.graph.is_connected(outport, inport)
+                or not self.reconciler.is_desired(outport, inport)):
+            return None
 
-    def list_ports(self, type_=jacklib.JackPortIsOutput, include_aliases=True,
-                   include_pretty_names=True):
-        print(self._format_ports(self.get_ports(type_, include_aliases, include_pretty_names)),
-              end='\n\n')
+        log.info("Connecting ports: '%s' --> '%s'.", outport, inport)
+        result = self.jack.connect(self.client, outport, inport)
 
-    def _format_ports(self, ports):
-        out = []
-        for output in ports:
-            out.append(output[0])
+        if result == 0:
+            self.reconciler.pending.add(conn)
+            self.metrics.inc('connects_total', labels=(('result', 'ok'),))
 
-            for alias in output[1:]:
-                if isinstance(alias, tuple):
-                    alias = alias[1]
-                out.append("    %s" % alias)
+            if inport not in self.reconciler.matches.get(outport, ()):
+                self.reconciler.mirrors.add(conn)
+        elif result == errno.EEXIST:
+            self.metrics.inc('connects_total', labels=(('result', 'exists'),))
+        else:
+            log.warning("Could not connect ports '%s' --> '%s' (error %i).",
+                        outport, inport, result)
+            self.metrics.inc('connects_total', labels=(('result', 'failed'),))
+            return False
+
+        self.graph.connect(outport, inport)
+        self._submit(self.reconciler.missing(self.reconciler.mirrored([conn])))
+        return True
+
+    def _unmirror(self, connections):
+        """Remove connections made by mirroring connections, which were removed."""
+        for outport, inport in connections:
+            log.info("Disconnecting mirrored ports: '%s' --> '%s'.", outport, inport)
+            result = self.jack.disconnect(self.client, outport, inport)
+
+            if result == 0:
+                self.graph.disconnect(outport, inport)
+                self.reconciler.mirrors.discard((outport, inport))
+                self.metrics.inc('disconnects_total', labels=(('result', 'ok'),))
+            else:
+                log.warning("Could not disconnect ports '%s' --> '%s' (error %i).",
+                            outport, inport, result)
+                self.metrics.inc('disconnects_total', labels=(('result', 'failed'),))
+
+    def _activate(self):
+        """Set JACK notification callbacks, activate client and load port graph."""
+        # Discard events from previous server connection
+        self.events.reset(keep=(PATTERNS_CHANGED, DUMP_METRICS, DUMP_TRACE, CONTROL_REQUEST))
+        self.jack.set_port_registration_callback(self.client, self.reg_callback, None)
+        self.jack.set_port_connect_callback(self.client, self.connect_callback, None)
+        self.jack.set_port_rename_callback(self.client, self.rename_callback, None)
+        self.jack.set_property_change_callback(self.client, self.property_callback, None)
+        self.jack.activate(self.client)
+        self._restore_connections()
+        self.load_graph()
+
+    def _attempt_connect(self, tries=1):
+        """Try to connect to the JACK server and, if that fails, schedule the next attempt."""
+        if self._open_client(tries):
+            self._activate()
+            # Set up connections for existing clients/ports.
+            self._reconcile(self._refresh(full=True))
+        elif self.connect_max_attempts and tries >= self.connect_max_attempts:
+            log.error("Maximum number (%i) of connection attempts reached. Aborting.",
+                      self.connect_max_attempts)
+            raise RuntimeError(self._connect_error)
+        else:
+            delay = self._connect_delay(tries)
+            log.debug("Waiting %.2f seconds to connect again...", delay)
+            self.loop.call_later(delay, self._attempt_connect, tries + 1)
 
-        return "\n".join(out)
+    def _poll_pattern_file(self):
+        self.watcher.check()
+        self.loop.call_later(self.watcher.poll_interval, self._poll_pattern_file)
 
     def run(self):
-        while True:
-            try:
-                self.connect()
-                jacklib.set_port_registration_callback(self.client, self.reg_callback, None)
-                jacklib.set_port_connect_callback(self.client, self.connect_callback, None)
-                jacklib.set_port_rename_callback(self.client, self.rename_callback, None)
-                jacklib.set_property_change_callback(self.client, self.property_callback, None)
-                jacklib.activate(self.client)
-                # Set up connections for existing clients/ports.
-                self._refresh()
-
-                while True:
-                    try:
-                        event = self.queue.get(timeout=1)
-                    except queue.Empty:
-                        continue
-
-                    if event is None:
-                        break
-                    else:
-                        (srcport, dstport) = event
-
-                    port = self._get_port(srcport)
-
-                    if not port:
-                        log.warning("Port vanished: %s", srcport)
-
-                    flags = jacklib.port_flags(port)
-
-                    if flags & jacklib.JackPortIsInput:
-                        to_connect = [(p, dstport) for _, p in self.get_connections([srcport])]
-                    else:
-                        to_connect = [(srcport, dstport)]
-
-                    for outport, inport in to_connect:
-                        port = self._get_port(outport)
-
-                        if not port:
-                            continue
-
-                        if not jacklib.port_connected_to(port, inport):
-                            log.info("Connecting ports: '%s' --> '%s'.", outport, inport)
-                            self.connection_cache[(outport, inport)] = True
-                            jacklib.connect(self.client, outport, inport)
-                        else:
-                            log.debug("Ports already connected: '%s' --> '%s'.", outport, inport)
-            except KeyboardInterrupt:
-                return
+        """Run the main loop until interrupted.
+
+        The main loop waits for events from the JACK notification callbacks, signal handlers,
+        the pattern file watcher, the metrics and control sockets and for timers (for
+        re-connecting to the JACK server and periodically writing the metrics file). It does
+        not wake up periodically when idle.
+
+        """
+        loop = self.loop
+        loop.add_reader(self.events, self._events_pending)
+
+        for server in (self.metrics_server, self.control_server):
+            if server is not None:
+                loop.add_reader(server, server.handle_request)
+
+        if self.watcher is not None:
+            if self.watcher.open() is not None:
+                loop.add_reader(self.watcher.fd, self.watcher.read_events)
+            else:
+                loop.call_later(self.watcher.poll_interval, self._poll_pattern_file)
+
+        if self.metrics_file:
+            self._write_metrics()
+
+        self._attempt_connect()
+
+        try:
+            loop.run()
+        except KeyboardInterrupt:
+            return
+
+
+def ctl_main(args=None):
+    ap = argparse.ArgumentParser(
+        prog=__program__ + ' ctl',
+        description="Add, remove or list pattern pairs of a running jack-matchmaker, save a "
+                    "snapshot of its port graph or show its recent match decisions via its "
+                    "control socket."
+    )
+    ap.add_argument('-N', '--client-name', metavar='NAME', default=__program__,
+                    help="JACK client name of the running jack-matchmaker, used to determine the "
+                         "default path of its control socket (default: '%(default)s')")
+    ap.add_argument('-s', '--socket', metavar="PATH",
+                    help="Path of control socket (default: '%s')" %
+                         default_control_socket('NAME'))
+    ap.add_argument('command', choices=['add', 'remove', 'list', 'snapshot', 'trace'],
+                    help="Add or remove the given pattern pairs, list all pattern pairs, "
+                         "output port graph snapshot as JSON or output recorded match decisions "
+                         "(needs --trace)")
+    ap.add_argument('patterns', nargs='*', help="Port pattern (pairs)")
+    args = ap.parse_args(args)
+
+    if args.command in ('list', 'snapshot', 'trace'):
+        if args.patterns:
+            ap.error("The '%s' command takes no patterns." % args.command)
+    elif not args.patterns or len(args.patterns) % 2:
+        ap.error("The '%s' command needs one or more pairs of patterns." % args.command)
+
+    try:
+        response = send_request(args.socket or default_control_socket(args.client_name),
+                                args.command, pairwise(args.patterns))
+    except ControlError as exc:
+        return str(exc)
+
+    if args.command == 'snapshot':
+        print(json.dumps(response['snapshot'], indent=1))
+    elif args.command == 'trace':
+        for record in response['trace']:
+            print(format_record(record))
+    elif args.command == 'list':
+        for ptn_output, ptn_input in response['pairs']:
+            print("%s\n    %s\n" % (ptn_output, ptn_input))
+    else:
+        print("%i pattern pair(s) %s." % (response['changed'],
+                                           'added' if args.command == 'add' else 'removed'))
 
 
 def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+
+    if args and args[0] == 'ctl':
+        return ctl_main(args[1:])
+
     doclines = __doc__.splitlines()
     ap = argparse.ArgumentParser(
         prog=__program__,
@@ -461,17 +1255,80 @@ def main(args=None):
                      help="Include aliases when listing ports")
     apg.add_argument('-n', '--pretty-names', action="store_true",
                      help="Include pretty-names from port meta data when listing ports")
+    apg.add_argument('--format', choices=LISTING_FORMATS, default='text',
+                     help="Output format for listing ports and connections and for the "
+                          "connection plan (default: %(default)s)")
+    apg.add_argument('--plan', metavar="SNAPSHOT",
+                     help="Match patterns against port graph snapshot in JSON format (as output "
+                          "with '-oican --format json') and output planned connections and "
+                          "statistics per pattern pair. Does not need a JACK server")
     ap.add_argument('-p', '--pattern-file', metavar="FILE",
                     help="Read pattern pairs from FILE (one pattern per line)")
+    ap.add_argument('-w', '--watch', action="store_true",
+                    help="Re-read pattern file automatically when it is changed")
+    ap.add_argument('--watch-interval', type=posfloat, default=DEFAULT_POLL_INTERVAL,
+                    metavar="SECONDS",
+                    help="Interval between checks for changes of the pattern file, where it can "
+                         "not be watched with inotify (default: %(default)s)")
     ap.add_argument('-e', '--exact-matching', action="store_true",
                     help="Enable literal matching mode. Patterns must match port names exactly. "
                          "To still use regular expressions, mark them with slashes, e.g. "
                          "'/system:out_\\d+/'.")
+    ap.add_argument('--no-aliases', dest='match_aliases', action="store_false",
+                    help="Do not match patterns against port aliases. Saves retrieving the aliases "
+                         "of every port.")
+    ap.add_argument('--unmirror', action="store_true",
+                    help="Remove connections made by mirroring the connections of an input port "
+                         "matched by the first pattern of a pair, when the mirrored connection "
+                         "is removed")
     ap.add_argument('-N', '--client-name', metavar='NAME', default=__program__,
                     help="Set JACK client name to NAME (default: '%(default)s')")
-    ap.add_argument('-I', '--connect-interval', type=posnum, default=3.0, metavar="SECONDS",
-                    help="Interval between attempts to connect to JACK server "
+    ap.add_argument('-I', '--connect-interval', type=posnum, default=DEFAULT_CONNECT_INTERVAL,
+                    metavar="SECONDS",
+                    help="Max. interval between attempts to connect to JACK server "
                     " (default: %(default)s)")
+    ap.add_argument('--connect-min-interval', type=posnum, default=DEFAULT_CONNECT_MIN_INTERVAL,
+                    metavar="SECONDS",
+                    help="Interval after the first failed attempt to connect to JACK server, "
+                         "which doubles with each further failed attempt up to the interval set "
+                         "with -I (default: %(default)s)")
+    ap.add_argument('-d', '--debounce', type=posnum, default=DEFAULT_DEBOUNCE, metavar="MS",
+                    help="Time window in milliseconds, in which port changes reported by JACK are "
+                         "collected before evaluating them together (default: %(default)s)")
+    ap.add_argument('--connect-rate', type=posnum, default=0, metavar="NUM",
+                    help="Max. number of port connections to make per second "
+                         "(default: 0=unlimited)")
+    ap.add_argument('--connect-window', type=posnum, default=0, metavar="MS",
+                    help="Time window in milliseconds, in which connections to make are collected "
+                         "before making them in order of priority (default: %(default)s)")
+    ap.add_argument('--connect-retries', type=nonnegint, default=DEFAULT_CONNECT_RETRIES,
+                    metavar="NUM",
+                    help="Max. number of retries, with increasing delay, when connecting two "
+                         "ports fails (default: %(default)s)")
+    ap.add_argument('--template-cache-size', type=posint, default=TEMPLATE_CACHE_MAXSIZE,
+                    metavar="NUM",
+                    help="Max. number of input port patterns resolved from templates with "
+                         "placeholders to keep in the cache (default: %(default)s)")
+    ap.add_argument('--metrics-file', metavar="FILE",
+                    help="Periodically write metrics in Prometheus text format to FILE")
+    ap.add_argument('--metrics-interval', type=posfloat, default=DEFAULT_METRICS_INTERVAL,
+                    metavar="SECONDS",
+                    help="Interval between writes of the metrics file (default: %(default)s)")
+    ap.add_argument('--metrics-socket', metavar="PATH",
+                    help="Send metrics in Prometheus text format to clients connecting to UNIX "
+                         "domain socket PATH")
+    ap.add_argument('-S', '--control-socket', nargs='?', const=True, metavar="PATH",
+                    help="Accept requests to add, remove and list pattern pairs on UNIX domain "
+                         "socket PATH (default: '%s', where NAME is the JACK client name). Use "
+                         "'jack-matchmaker ctl' to send requests." % default_control_socket('NAME'))
+    ap.add_argument('--trace', type=nonnegint, nargs='?', const=DEFAULT_TRACE_SIZE, default=0,
+                    metavar="SIZE",
+                    help="Record the last SIZE match decisions in memory (default: %(const)s), "
+                         "to be logged on a USR2 signal or shown with 'jack-matchmaker ctl "
+                         "trace'")
+    ap.add_argument('--trace-sample', type=posint, default=1, metavar="N",
+                    help="Only record every N-th match decision for each pattern pair "
+                         "(default: %(default)s)")
     ap.add_argument('-m', '--max-attempts', type=posnum, default=0, metavar="NUM",
                     help="Max. number of attempts to connect to JACK server (default: 0=infinite)."
                           " Always 1 when any of the -c, -i or -o options are used.")
@@ -485,11 +1342,18 @@ def main(args=None):
 
     logging.basicConfig(level=args.verbosity, format="%(levelname)s: %(message)s")
 
-    if args.patterns and args.pattern_file:
-        log.warning("Port pattern pairs from command line will be discarded when pattern file is "
-                    "re-read on HUP signal.")
+    if args.control_socket is True:
+        args.control_socket = default_control_socket(args.client_name)
+
+    if args.plan:
+        return run_plan(args.plan, pairwise(args.patterns), args.pattern_file,
+                        exact_matching=args.exact_matching, match_aliases=args.match_aliases,
+                        template_cache_size=args.template_cache_size, format=args.format)
 
-    if args.actions or args.patterns or args.pattern_file:
+    if args.watch and not args.pattern_file:
+        log.warning("No pattern file given. Option -w/--watch is ignored.")
+
+    if args.actions or args.patterns or args.pattern_file or args.control_socket:
         try:
             matchmaker = JackMatchmaker(
                 pairwise(args.patterns),
@@ -497,7 +1361,23 @@ def main(args=None):
                 name=args.client_name,
                 exact_matching=args.exact_matching,
                 connect_interval=args.connect_interval,
-                connect_max_attempts=args.max_attempts
+                connect_max_attempts=args.max_attempts,
+                connect_min_interval=args.connect_min_interval,
+                connect_rate=args.connect_rate,
+                connect_window=args.connect_window / 1000,
+                connect_retries=args.connect_retries,
+                unmirror=args.unmirror,
+                trace_size=args.trace,
+                trace_sample=args.trace_sample,
+                debounce=args.debounce / 1000,
+                template_cache_size=args.template_cache_size,
+                metrics_file=args.metrics_file,
+                metrics_interval=args.metrics_interval,
+                metrics_socket=args.metrics_socket,
+                control_socket=args.control_socket,
+                watch_pattern_file=args.watch,
+                watch_interval=args.watch_interval,
+                match_aliases=args.match_aliases
             )
         except (OSError, RuntimeError) as exc:
             return str(exc)
@@ -508,15 +1388,20 @@ def main(args=None):
     try:
         if args.actions:
             matchmaker.connect(max_attempts=1)
+            matchmaker.load_graph(aliases=args.aliases, pretty_names=args.pretty_names,
+                                  connections='list_cnx' in args.actions)
+            writer = ListingWriter(sys.stdout, args.format)
 
             if 'list_outs' in args.actions:
-                matchmaker.list_ports(jacklib.JackPortIsOutput, include_aliases=args.aliases,
-                                      include_pretty_names=args.pretty_names)
+                matchmaker.list_ports(PORT_IS_OUTPUT, include_aliases=args.aliases,
+                                      include_pretty_names=args.pretty_names, writer=writer)
             if 'list_ins' in args.actions:
-                matchmaker.list_ports(jacklib.JackPortIsInput, include_aliases=args.aliases,
-                                      include_pretty_names=args.pretty_names)
+                matchmaker.list_ports(PORT_IS_INPUT, include_aliases=args.aliases,
+                                      include_pretty_names=args.pretty_names, writer=writer)
             if 'list_cnx' in args.actions:
-                matchmaker.list_connections(args.patterns)
+                matchmaker.list_connections(args.patterns, writer=writer)
+
+            writer.close()
         else:
             matchmaker.run()
     except KeyboardInterrupt:
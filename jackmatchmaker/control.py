@@ -0,0 +1,166 @@
+"""Control socket for changing the pattern pairs of a running jack-matchmaker.
+
+The protocol is line-based: the client sends one JSON object per line and receives one JSON
+object per line in reply. Requests have a ``command`` key and, depending on the command, a
+``pairs`` key with a list of ``[output_pattern, input_pattern]`` lists:
+
+``{"command": "add", "pairs": [["system:capture_1", "system:playback_1"]]}``
+    Add pattern pairs. Either all pairs are added or, if any pattern is invalid, none.
+``{"command": "remove", "pairs": [["system:capture_1", "system:playback_1"]]}``
+    Remove pattern pairs.
+``{"command": "list"}``
+    List all pattern pairs.
+``{"command": "snapshot"}``
+    Return a snapshot of the port graph (see ``jackmatchmaker.snapshot``) in the ``snapshot``
+    key of the reply.
+``{"command": "trace"}``
+    Return the recorded match decisions (see ``jackmatchmaker.trace``) in the ``trace`` key of
+    the reply. Fails if tracing is not enabled.
+
+Replies have an ``ok`` key, which is ``true`` on success and ``false`` on failure, in which case
+the ``error`` key contains an error message.
+
+Requests are executed by the main loop of jack-matchmaker, not by the thread serving the socket
+connection, so they are never interleaved with the processing of JACK notifications.
+
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+
+from .metrics import remove_stale_socket
+
+
+log = logging.getLogger("jack-matchmaker")
+CONTROL_TIMEOUT = 5.0
+
+
+def default_control_socket(name="jack-matchmaker"):
+    """Return default path of the control socket of the instance with the given client name."""
+    rundir = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(rundir, name.replace(os.sep, '_') + '.sock')
+
+
+class ControlError(Exception):
+    pass
+
+
+class ControlRequest(object):
+    """Request received on the control socket, waiting for the main loop to reply to it."""
+
+    def __init__(self, command, pairs=()):
+        self.command = command
+        self.pairs = pairs
+        self.response = None
+        self._done = threading.Event()
+
+    def reply(self, **response):
+        self.response = response
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """Wait for reply and return it (``None`` on timeout)."""
+        self._done.wait(timeout)
+        return self.response
+
+
+class ControlRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.handle_line(line)
+            except ControlError as exc:
+                response = dict(ok=False, error=str(exc))
+
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """UNIX domain socket server, which passes requests to a callback function.
+
+    New connections are accepted by calling ``handle_request`` from the main loop, when the
+    socket (see ``fileno``) is readable. Each connection is then served by its own thread.
+
+    The callback is called with a ``ControlRequest`` from the thread serving the connection and
+    must arrange for ``request.reply`` to be called, usually from the main loop.
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, callback, reply_timeout=CONTROL_TIMEOUT):
+        self.callback = callback
+        self.reply_timeout = reply_timeout
+        remove_stale_socket(path)
+        super().__init__(path, ControlRequestHandler)
+
+    def handle_line(self, line):
+        try:
+            data = json.loads(line.decode('utf-8'))
+            command = data['command']
+            pairs = [tuple(pair) for pair in data.get('pairs', ())]
+        except (ValueError, KeyError, TypeError, AttributeError) as exc:
+            raise ControlError("Invalid request: %s" % exc)
+
+        if command not in ('add', 'remove', 'list', 'snapshot', 'trace'):
+            raise ControlError("Unknown command: %s" % command)
+
+        if any(len(pair) != 2 or not all(isinstance(ptn, str) for ptn in pair)
+               for pair in pairs):
+            raise ControlError("Invalid request: pairs must be lists of two strings.")
+
+        request = ControlRequest(command, pairs)
+        self.callback(request)
+        response = request.wait(self.reply_timeout)
+
+        if response is None:
+            raise ControlError("Timeout waiting for request to be processed.")
+
+        return response
+
+    def server_close(self):
+        super().server_close()
+
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def send_request(path, command, pairs=(), timeout=CONTROL_TIMEOUT * 2):
+    """Send request to control socket at path and return reply.
+
+    Raises ``ControlError``, if the request failed.
+
+    """
+    request = dict(command=command)
+
+    if pairs:
+        request['pairs'] = [list(pair) for pair in pairs]
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+
+            with sock.makefile('rb') as fp:
+                line = fp.readline()
+    except OSError as exc:
+        raise ControlError("Could not send request to control socket '%s': %s" % (path, exc))
+
+    try:
+        response = json.loads(line.decode('utf-8'))
+    except ValueError:
+        raise ControlError("Invalid response from control socket '%s'." % path)
+
+    if not response.get('ok'):
+        raise ControlError(response.get('error', "Unknown error"))
+
+    return response
@@ -0,0 +1,178 @@
+"""Events reported by JACK notification callbacks and collection of port graph changes."""
+
+import socket
+import threading
+
+from collections import deque, namedtuple
+
+
+EVENT_QUEUE_MAXSIZE = 4096
+
+PORT_REGISTERED = 'registered'
+PORT_RENAMED = 'renamed'
+PORT_CONNECTED = 'connected'
+PROPERTY_CHANGED = 'property'
+PATTERNS_CHANGED = 'patterns'
+DUMP_METRICS = 'dump'
+DUMP_TRACE = 'trace'
+CONTROL_REQUEST = 'control'
+SHUTDOWN = 'shutdown'
+
+# Generic record for all event types:
+# - PORT_REGISTERED: (port_id, registered, None)
+# - PORT_RENAMED: (port_id, old_name, new_name), names not decoded yet
+# - PORT_CONNECTED: (port_a_id, port_b_id, connected)
+# - PROPERTY_CHANGED: (subject, key, change), key not decoded yet
+# - CONTROL_REQUEST: (request, None, None), request is a ``control.ControlRequest``
+# - PATTERNS_CHANGED, DUMP_METRICS, DUMP_TRACE and SHUTDOWN: (None, None, None)
+# ``time`` is the value of ``time.monotonic()`` when the event was created.
+Event = namedtuple('Event', ('type', 'arg1', 'arg2', 'arg3', 'time'))
+Event.__new__.__defaults__ = (None, None, None, None)
+
+
+class EventQueue(object):
+    """Bounded FIFO queue of events with a file descriptor signalling pending events.
+
+    ``put`` never blocks for longer than it takes to append to the queue, so it is safe to call
+    from the JACK notification thread and from signal handlers. When the queue is full, the
+    event is dropped and the ``overflowed`` flag is set. The consumer should then discard all
+    queued events with ``reset`` and re-sync its state from scratch.
+
+    ``SHUTDOWN``, ``PATTERNS_CHANGED``, ``DUMP_METRICS``, ``DUMP_TRACE`` and ``CONTROL_REQUEST``
+    events are never dropped.
+
+    When an event is put on the empty queue, a byte is written to a socket pair, so the consumer
+    can wait for events with ``select`` (or ``selectors``) on ``fileno`` together with other
+    file descriptors, instead of polling the queue. The consumer must call ``clear_wakeup``
+    before taking events from the queue with ``get_all``.
+
+    The highest number of events in the queue is recorded in ``peak``.
+
+    """
+
+    CONTROL_EVENTS = (SHUTDOWN, PATTERNS_CHANGED, DUMP_METRICS, DUMP_TRACE, CONTROL_REQUEST)
+
+    def __init__(self, maxsize=EVENT_QUEUE_MAXSIZE):
+        self.maxsize = maxsize
+        self.overflowed = False
+        self.overflows = 0
+        self.peak = 0
+        self._events = deque()
+        # re-entrant, since signal handlers may put events while the main thread holds the lock
+        self._lock = threading.RLock()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+
+    def __len__(self):
+        return len(self._events)
+
+    def fileno(self):
+        """Return file descriptor, which becomes readable when events are pending."""
+        return self._wakeup_r.fileno()
+
+    def close(self):
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+    def put(self, event):
+        with self._lock:
+            if len(self._events) >= self.maxsize and event.type not in self.CONTROL_EVENTS:
+                self.overflowed = True
+                self.overflows += 1
+                return False
+
+            self._events.append(event)
+
+            if len(self._events) > self.peak:
+                self.peak = len(self._events)
+
+            if len(self._events) == 1:
+                try:
+                    self._wakeup_w.send(b'\0')
+                except OSError:
+                    # socket buffer full, i.e. wake-up is pending anyway
+                    pass
+
+            return True
+
+    def clear_wakeup(self):
+        """Read all pending wake-up bytes from ``fileno``."""
+        try:
+            while self._wakeup_r.recv(4096):
+                pass
+        except OSError:
+            pass
+
+    def get_all(self):
+        """Remove all queued events from the queue and return them as a list."""
+        with self._lock:
+            # Swap queues first, so an event put by a signal handler interrupting us is either in
+            # the returned list or stays queued, but is never lost.
+            events, self._events = self._events, deque()
+            return list(events)
+
+    def reset(self, keep=CONTROL_EVENTS):
+        """Discard all queued events, except those with a type in ``keep``, and clear
+        ``overflowed`` flag.
+
+        Returns the number of discarded events.
+
+        """
+        with self._lock:
+            events, self._events = self._events, deque()
+            kept = [e for e in events if e.type in keep]
+            self._events.extendleft(reversed(kept))
+            self.overflowed = False
+            return len(events) - len(kept)
+
+
+class PortChanges(object):
+    """Set of ports changed since the last refresh.
+
+    Changes to the same port are merged, so a burst of notifications about a port results in
+    only one re-evaluation of the patterns for it. Insertion order is preserved, so that e.g. a
+    port, which was unregistered and then registered again under the same name, is re-evaluated
+    and not forgotten.
+
+    Port changes are only marked and popped by the main loop, so no locking is needed.
+
+    """
+
+    FORGET = 'forget'
+
+    def __init__(self):
+        self.clear()
+
+    def __bool__(self):
+        return self.full_refresh or bool(self.ports)
+
+    def clear(self):
+        self.full_refresh = False
+        # port name -> FORGET or tuple (as_source, as_destination)
+        self.ports = {}
+
+    def mark_port(self, port_name, as_source=True, as_destination=True):
+        """Mark port for matching as a source and/or destination."""
+        action = self.ports.pop(port_name, None)
+
+        if action and action != self.FORGET:
+            as_source = as_source or action[0]
+            as_destination = as_destination or action[1]
+
+        self.ports[port_name] = (as_source, as_destination)
+
+    def forget_port(self, port_name):
+        """Mark port as removed."""
+        self.ports.pop(port_name, None)
+        self.ports[port_name] = self.FORGET
+
+    def mark_full_refresh(self):
+        """Mark the whole graph as dirty."""
+        self.full_refresh = True
+
+    def pop(self):
+        """Return ``(full_refresh, ports)`` and reset the change set."""
+        changes = (self.full_refresh, self.ports)
+        self.clear()
+        return changes
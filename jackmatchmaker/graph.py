@@ -0,0 +1,251 @@
+"""In-memory model of the JACK port graph."""
+
+# Port flags (same values as in the JACK API)
+PORT_IS_INPUT = 0x1
+PORT_IS_OUTPUT = 0x2
+PORT_IS_PHYSICAL = 0x4
+PORT_IS_TERMINAL = 0x10
+PORT_IS_CV = 0x100
+
+# Port types (same values as in the JACK API)
+AUDIO_TYPE = "32 bit float mono audio"
+MIDI_TYPE = "8 bit raw midi"
+
+
+class Port(object):
+    """Record of a JACK port with its name, aliases, pretty name and other properties.
+
+    ``id`` is the JACK port ID as passed to notification callbacks and ``uuid`` the port UUID,
+    which is the subject of port meta data properties. Both may be ``None``, if not known.
+
+    ``aliases`` and ``pretty_name`` are ``None``, if they were not retrieved (yet). A port
+    without aliases resp. pretty name has an empty tuple resp. string.
+
+    """
+
+    __slots__ = ('name', 'id', 'uuid', 'flags', 'type', 'aliases', 'pretty_name')
+
+    def __init__(self, name, flags=0, type=None, aliases=None, pretty_name=None, id=None,
+                 uuid=None):
+        self.name = name
+        self.flags = flags
+        self.type = type
+        self.aliases = None if aliases is None else tuple(aliases)
+        self.pretty_name = pretty_name
+        self.id = id
+        self.uuid = uuid
+
+    def __repr__(self):
+        return "<Port %s>" % self.name
+
+    @property
+    def client(self):
+        return self.name.split(':', 1)[0]
+
+    @property
+    def full_pretty_name(self):
+        """Return pretty name prefixed with client name and colon or ``None``."""
+        if not self.pretty_name:
+            return None
+
+        if ':' in self.name:
+            return self.client + ':' + self.pretty_name
+
+        return self.pretty_name
+
+    @property
+    def is_input(self):
+        return bool(self.flags & PORT_IS_INPUT)
+
+    @property
+    def is_output(self):
+        return bool(self.flags & PORT_IS_OUTPUT)
+
+    def names(self, include_aliases=True, include_pretty_name=True):
+        """Return list of port name, aliases and pretty name (prefixed with client name).
+
+        Aliases and pretty name are omitted, if they were not retrieved.
+
+        """
+        names = [self.name]
+
+        if include_aliases and self.aliases:
+            names.extend(self.aliases)
+
+        if include_pretty_name and self.pretty_name:
+            names.append(self.full_pretty_name)
+
+        return names
+
+
+class Graph(object):
+    """Ports and connections of a JACK server, indexed by port name, ID and UUID.
+
+    Connections are stored as a dictionary mapping output port names to the set of names of the
+    input ports they are connected to and, reversed, as a dictionary mapping input port names to
+    the set of names of the output ports connected to them.
+
+    Input ports are also bucketed by port type, since ports can only be connected to ports of the
+    same type, so matching destinations for a source port only needs to look at one bucket.
+
+    """
+
+    def __init__(self):
+        self.ports = {}
+        self.by_id = {}
+        self.by_uuid = {}
+        self.connections = {}
+        # input port name -> set of output port names
+        self.reverse_connections = {}
+        # port type -> {port name: input port}
+        self.inputs_by_type = {}
+
+    def __contains__(self, name):
+        return name in self.ports
+
+    def __iter__(self):
+        return iter(self.ports.values())
+
+    def __len__(self):
+        return len(self.ports)
+
+    def get(self, name):
+        return self.ports.get(name)
+
+    def inputs(self, type=None):
+        """Return iterable of input ports, optionally only those of given port type."""
+        if type is not None:
+            return self.inputs_by_type.get(type, {}).values()
+
+        return (port for port in self.ports.values() if port.flags & PORT_IS_INPUT)
+
+    def outputs(self):
+        return (port for port in self.ports.values() if port.flags & PORT_IS_OUTPUT)
+
+    def add(self, port):
+        """Add port record, replacing any existing record for a port with the same name."""
+        old = self.ports.get(port.name)
+
+        if old is not None:
+            self._unindex(old)
+
+            if port.id is None:
+                port.id = old.id
+
+        self.ports[port.name] = port
+        self._index(port)
+
+    def remove(self, name):
+        """Remove port and all its connections. Returns removed port record or ``None``."""
+        port = self.ports.pop(name, None)
+
+        if port is not None:
+            self._unindex(port)
+
+            for dst in self.connections.pop(name, ()):
+                self._discard(self.reverse_connections, dst, name)
+
+            for src in self.reverse_connections.pop(name, ()):
+                self._discard(self.connections, src, name)
+
+        return port
+
+    def rename(self, old_name, new_name):
+        """Rename port and update its connections. Returns port record or ``None``."""
+        port = self.ports.pop(old_name, None)
+
+        if port is None:
+            return None
+
+        port.name = new_name
+        self.ports[new_name] = port
+        inputs = self.inputs_by_type.get(port.type)
+
+        if inputs is not None and inputs.get(old_name) is port:
+            del inputs[old_name]
+            inputs[new_name] = port
+
+        self._rename_key(self.connections, self.reverse_connections, old_name, new_name)
+        self._rename_key(self.reverse_connections, self.connections, old_name, new_name)
+        return port
+
+    @staticmethod
+    def _rename_key(mapping, reverse, old_name, new_name):
+        others = mapping.pop(old_name, None)
+
+        if others is not None:
+            mapping[new_name] = others
+
+            for other in others:
+                values = reverse[other]
+                values.discard(old_name)
+                values.add(new_name)
+
+    def set_id(self, port, id):
+        if port.id is not None:
+            self.by_id.pop(port.id, None)
+
+        port.id = id
+        self.by_id[id] = port
+
+    def clear_ids(self):
+        """Forget port IDs, which are only valid while connected to the same server."""
+        for port in self.by_id.values():
+            port.id = None
+
+        self.by_id = {}
+
+    def connect(self, src, dst):
+        self.connections.setdefault(src, set()).add(dst)
+        self.reverse_connections.setdefault(dst, set()).add(src)
+
+    def disconnect(self, src, dst):
+        self._discard(self.connections, src, dst)
+        self._discard(self.reverse_connections, dst, src)
+
+    def is_connected(self, src, dst):
+        return dst in self.connections.get(src, ())
+
+    def get_connections(self, name):
+        """Return list of names of all ports connected to given port."""
+        port = self.ports.get(name)
+
+        if port is None:
+            return []
+
+        if port.flags & PORT_IS_INPUT:
+            return list(self.reverse_connections.get(name, ()))
+
+        return list(self.connections.get(name, ()))
+
+    @staticmethod
+    def _discard(mapping, key, value):
+        values = mapping.get(key)
+
+        if values is not None:
+            values.discard(value)
+
+            if not values:
+                del mapping[key]
+
+    def _index(self, port):
+        if port.id is not None:
+            self.by_id[port.id] = port
+
+        if port.uuid is not None:
+            self.by_uuid[port.uuid] = port
+
+        if port.flags & PORT_IS_INPUT:
+            self.inputs_by_type.setdefault(port.type, {})[port.name] = port
+
+    def _unindex(self, port):
+        if self.by_id.get(port.id) is port:
+            del self.by_id[port.id]
+
+        if self.by_uuid.get(port.uuid) is port:
+            del self.by_uuid[port.uuid]
+
+        inputs = self.inputs_by_type.get(port.type)
+
+        if inputs is not None and inputs.get(port.name) is port:
+            del inputs[port.name]
@@ -0,0 +1,136 @@
+"""Listing ports and connections of the port graph as text, JSON or JSON lines."""
+
+import json
+import re
+
+
+FORMATS = ('text', 'json', 'jsonl')
+
+
+def compile_filters(patterns):
+    """Compile listing filter patterns into regexes.
+
+    Patterns without uppercase letters match case-insensitively. Raises ``re.error`` if any
+    pattern is not a valid regular expression.
+
+    """
+    return [re.compile(ptn, re.I if ptn.lower() == ptn else 0) for ptn in patterns]
+
+
+def filter_connections(graph, filters=None):
+    """Yield ``(output, input)`` tuples of port names for connections of all output ports.
+
+    If ``filters`` (a list of compiled regexes) is not empty, only connections where any of
+    them matches part of the name of either port are yielded.
+
+    """
+    for port in graph.outputs():
+        dsts = graph.connections.get(port.name)
+
+        if not dsts:
+            continue
+
+        if not filters or any(rx.search(port.name) for rx in filters):
+            for dst in dsts:
+                yield (port.name, dst)
+        else:
+            for dst in dsts:
+                if any(rx.search(dst) for rx in filters):
+                    yield (port.name, dst)
+
+
+def port_record(port, include_aliases=True, include_pretty_names=True):
+    """Return dictionary with properties of port for JSON output."""
+    record = dict(name=port.name, type=port.type, flags=port.flags, uuid=port.uuid)
+
+    if include_aliases:
+        record['aliases'] = list(port.aliases or ())
+
+    if include_pretty_names:
+        record['pretty_name'] = port.pretty_name or None
+
+    return record
+
+
+class ListingWriter(object):
+    """Write listings of ports and connections to a file object as they are produced.
+
+    Listings are written in sections ("outputs", "inputs" and "connections") in one of these
+    formats:
+
+    ``text``
+        Port names, each followed by its aliases and pretty name indented, resp. pairs of
+        connected port names in the same format as pattern files.
+    ``json``
+        One JSON object with a list of records for each section.
+    ``jsonl``
+        One JSON object per line for each record, with a ``kind`` key containing the section
+        name in singular.
+
+    ``close`` must be called after writing all sections to complete the output.
+
+    """
+
+    def __init__(self, fp, format='text'):
+        if format not in FORMATS:
+            raise ValueError("Unknown listing format: %s" % format)
+
+        self.fp = fp
+        self.format = format
+        self._sections = 0
+
+    def write_ports(self, ports, section='outputs', include_aliases=True,
+                    include_pretty_names=True):
+        if self.format == 'text':
+            write = self.fp.write
+
+            for port in ports:
+                names = port.names(include_aliases, include_pretty_names)
+                write(names[0] + '\n')
+
+                for alias in names[1:]:
+                    write("    %s\n" % alias)
+
+            write('\n')
+        else:
+            self.write_records(section, (port_record(port, include_aliases,
+                                                      include_pretty_names)
+                                          for port in ports))
+
+    def write_connections(self, connections):
+        if self.format == 'text':
+            write = self.fp.write
+
+            for outport, inport in connections:
+                write("%s\n    %s\n\n" % (outport, inport))
+        else:
+            self.write_records('connections', (dict(output=outport, input=inport)
+                                                for outport, inport in connections))
+
+    def close(self):
+        if self.format == 'json':
+            self.fp.write('}\n' if self._sections else '{}\n')
+
+        self.fp.flush()
+
+    def write_records(self, section, records):
+        """Write section of records (dictionaries) in JSON or JSON lines format."""
+        write, dumps = self.fp.write, json.dumps
+
+        if self.format == 'jsonl':
+            kind = section[:-1] if section.endswith('s') else section
+
+            for record in records:
+                write(dumps(dict(kind=kind, **record)) + '\n')
+        else:
+            write('{' if not self._sections else ',\n')
+            write('%s: [' % dumps(section))
+            sep = '\n'
+
+            for record in records:
+                write(sep + dumps(record))
+                sep = ',\n'
+
+            write('\n]')
+
+        self._sections += 1
@@ -0,0 +1,94 @@
+"""Minimal event loop multiplexing readable file descriptors and timers."""
+
+import heapq
+import selectors
+import time
+
+from itertools import count
+
+
+class Timer(object):
+    """Handle for a callback scheduled with ``EventLoop.call_at`` or ``call_later``."""
+
+    __slots__ = ('when', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class EventLoop(object):
+    """Event loop calling callbacks when file descriptors become readable or timers expire.
+
+    The loop blocks in the selector until a registered file descriptor becomes readable or the
+    next timer is due, so there are no periodic wake-ups when nothing happens. Signal handlers
+    run while the loop waits, so they can wake it by writing to a registered file descriptor.
+
+    All callbacks are called from the thread running the loop. The number of times the loop woke
+    up is counted in ``wakeups``.
+
+    """
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.wakeups = 0
+        self._running = False
+        self._seq = count()
+        # heap of (when, sequence number, timer)
+        self._timers = []
+
+    def add_reader(self, fileobj, callback, *args):
+        self.selector.register(fileobj, selectors.EVENT_READ, (callback, args))
+
+    def remove_reader(self, fileobj):
+        try:
+            self.selector.unregister(fileobj)
+        except (KeyError, ValueError):
+            pass
+
+    def call_at(self, when, callback, *args):
+        """Call callback at given time (in the reference of ``time.monotonic``)."""
+        timer = Timer(when, callback, args)
+        heapq.heappush(self._timers, (when, next(self._seq), timer))
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(time.monotonic() + delay, callback, *args)
+
+    def stop(self):
+        self._running = False
+
+    def close(self):
+        self.selector.close()
+        self._timers = []
+
+    def run(self):
+        """Run loop until ``stop`` is called."""
+        self._running = True
+
+        while self._running:
+            timers = self._timers
+
+            while timers and timers[0][2].cancelled:
+                heapq.heappop(timers)
+
+            timeout = max(0, timers[0][0] - time.monotonic()) if timers else None
+            ready = self.selector.select(timeout)
+            self.wakeups += 1
+
+            for key, _ in ready:
+                callback, args = key.data
+                callback(*args)
+
+            now = time.monotonic()
+
+            while timers and timers[0][0] <= now:
+                _, _, timer = heapq.heappop(timers)
+
+                if not timer.cancelled:
+                    timer.callback(*timer.args)
@@ -0,0 +1,263 @@
+"""Matching ports of the port graph against pattern pairs."""
+
+import re
+import time
+
+from collections import defaultdict
+from itertools import chain
+
+
+class RuleStats(object):
+    """Number of source ports and port pairs matched by a pattern pair and time spent."""
+
+    __slots__ = ('sources', 'pairs', 'seconds')
+
+    def __init__(self):
+        self.sources = 0
+        self.pairs = 0
+        self.seconds = 0.0
+
+
+class Matcher(object):
+    """Match ports of a port graph against the pattern pairs of a ``PatternIndex``.
+
+    The input port patterns resolved from the pairs matching a source port are remembered in
+    ``resolved``, so input ports registered later can be matched as destinations against them
+    without matching all source ports again.
+
+    The priority of matched port pairs is the highest priority of the pattern pairs matching
+    them (see ``priority``).
+
+    Ports, which matched the source pattern of no pattern pair, are remembered in ``unmatched``
+    with their flags, type, aliases and pretty name, so they are not matched again, as long as
+    these and the pattern pairs do not change. The cache is only valid for the pattern generation
+    in ``unmatched_generation`` (see ``keep_unmatched``) and entries must be invalidated with
+    ``invalidate``, when a port is renamed, unregistered or its pretty name changes.
+
+    If ``stats`` is a dictionary, a ``RuleStats`` instance is kept in it for each pattern pair,
+    which matched any port, with the time spent resolving its input port pattern and matching
+    destinations for it.
+
+    Match decisions are recorded by a ``MatchTracer``, if one is set (see ``set_tracer``).
+
+    """
+
+    def __init__(self, patterns, graph, stats=None, tracer=None):
+        self.patterns = patterns
+        self.graph = graph
+        self.stats = stats
+        self.unmatched_hits = 0
+        self.set_tracer(tracer)
+        self.clear()
+        self.clear_unmatched()
+
+    def set_tracer(self, tracer):
+        """Set ``MatchTracer`` recording match decisions or ``None`` to disable tracing.
+
+        Input port patterns are only tested by the traced variant of ``_match_input``, while a
+        tracer is set, so tracing costs nothing when it is disabled.
+
+        """
+        self.tracer = tracer
+
+        if tracer is None:
+            self.__dict__.pop('_match_input', None)
+        else:
+            self._match_input = self._traced_match_input
+
+    def clear(self):
+        # source port name -> {(input port pattern, destination port filter, priority): pair}
+        self.resolved = defaultdict(dict)
+        # source port name -> {destination port name: priority} (only for non-zero priorities)
+        self.priorities = {}
+
+    def clear_unmatched(self):
+        # port name -> (flags, type, names) of ports matching no source pattern
+        self.unmatched = {}
+        self.unmatched_generation = self.patterns.generation
+
+    def invalidate(self, port_name):
+        """Remove port from the cache of ports matching no source pattern."""
+        self.unmatched.pop(port_name, None)
+
+    def keep_unmatched(self, port_names=()):
+        """Keep cache of non-matching ports for the current pattern generation.
+
+        Must be called after pattern pairs were added or removed, with the names of all ports
+        matched by the source pattern of any added pair, which are invalidated. Otherwise the
+        cache is cleared on the next match.
+
+        """
+        for port_name in port_names:
+            self.unmatched.pop(port_name, None)
+
+        self.unmatched_generation = self.patterns.generation
+
+    def forget(self, port_name):
+        """Drop input port patterns resolved for and priorities of pairs with the given port."""
+        self.resolved.pop(port_name, None)
+
+        if self.priorities:
+            self.priorities.pop(port_name, None)
+
+            for dsts in self.priorities.values():
+                dsts.pop(port_name, None)
+
+    def priority(self, src, dst):
+        """Return priority of matched port pair."""
+        return self.priorities.get(src, {}).get(dst, 0)
+
+    def _set_priority(self, src, dst, priority):
+        dsts = self.priorities.setdefault(src, {})
+
+        if priority > dsts.get(dst, priority - 1):
+            dsts[dst] = priority
+
+    def match_all(self):
+        """Match all ports of the graph as sources. Yields the resulting port pairs."""
+        self.clear()
+
+        for port in chain(self.graph.outputs(), self.graph.inputs()):
+            yield from self.match_source(port)
+
+    def match_source(self, port):
+        """Match port names of one port against the source pattern of all pattern pairs.
+
+        For each match, the input port pattern of the pair is resolved (i.e. match groups are
+        substituted and the result is compiled), remembered for the source port and matched
+        against all input ports of the same port type, which pass the destination port filter of
+        the pair. Pairs, whose source port filter the port does not pass, are skipped. Ports in the
+        cache of non-matching ports are skipped entirely. Yields the resulting port pairs.
+
+        """
+        if self.unmatched_generation != self.patterns.generation:
+            self.clear_unmatched()
+
+        names = port.names()
+        key = (port.flags, port.type, names)
+
+        if self.unmatched.get(port.name) == key:
+            self.unmatched_hits += 1
+            return
+
+        matches = {}
+        tracer = self.tracer
+
+        for output in names:
+            for pair, match_output in self.patterns.match(output, port.type):
+                if pair not in matches:
+                    if pair.source_filter is not None and not pair.source_filter.matches(port):
+                        if tracer is not None:
+                            tracer.record('source', port.name, output, pair.output, None, pair)
+
+                        continue
+
+                    if tracer is not None:
+                        tracer.record('source', port.name, output, pair.output, True, pair)
+
+                    matches[pair] = match_output
+
+        if not matches:
+            if tracer is not None:
+                tracer.record('source', port.name, port.name, None, False)
+
+            self.unmatched[port.name] = key
+            return
+
+        stats = self.stats
+
+        for pair, match_output in matches.items():
+            if stats is None:
+                yield from self._match_pair(port, pair, match_output)
+                continue
+
+            start = time.perf_counter()
+            pairs = list(self._match_pair(port, pair, match_output))
+            rule = stats.get(pair)
+
+            if rule is None:
+                rule = stats[pair] = RuleStats()
+
+            rule.sources += 1
+            rule.pairs += len(pairs)
+            rule.seconds += time.perf_counter() - start
+            yield from pairs
+
+    def _match_pair(self, port, pair, match_output):
+        ptn_input_xformed = self.patterns.resolve_input(pair, match_output)
+
+        if ptn_input_xformed is None:
+            return
+
+        resolved = self.resolved[port.name]
+        dest_filter, priority = pair.dest_filter, pair.priority
+        entry = (ptn_input_xformed, dest_filter, priority)
+
+        if entry in resolved:
+            return
+
+        resolved[entry] = pair
+
+        for input_port in self.graph.inputs(port.type):
+            if ((dest_filter is None or dest_filter.matches(input_port))
+                    and self._match_input(ptn_input_xformed, input_port, pair)):
+                if priority:
+                    self._set_priority(port.name, input_port.name, priority)
+
+                yield (port.name, input_port.name)
+
+    def match_destination(self, port):
+        """Match port names of one input port against all resolved input port patterns of
+        source ports of the same port type.
+
+        """
+        for src_port, patterns in self.resolved.items():
+            src = self.graph.get(src_port)
+
+            if src is None or src.type != port.type:
+                continue
+
+            matched = False
+
+            for (ptn_input, dest_filter, priority), pair in patterns.items():
+                if ((dest_filter is None or dest_filter.matches(port))
+                        and self._match_input(ptn_input, port, pair)):
+                    if priority:
+                        self._set_priority(src_port, port.name, priority)
+                    elif matched:
+                        continue
+
+                    matched = True
+
+            if matched:
+                yield (src_port, port.name)
+
+    def _match_input(self, ptn_input, port, pair=None):
+        """Return whether any of the names of an input port matches the input port pattern.
+
+        ``pair`` is the pattern pair the input port pattern was resolved from. It is only used
+        for tracing.
+
+        """
+        if isinstance(ptn_input, re.Pattern):
+            match = ptn_input.match
+            return any(match(input) for input in port.names())
+
+        return ptn_input in port.names()
+
+    def _traced_match_input(self, ptn_input, port, pair=None):
+        """Same as ``_match_input``, but records each test with the tracer."""
+        record = self.tracer.record
+
+        for input in port.names():
+            if isinstance(ptn_input, re.Pattern):
+                matched = ptn_input.match(input) is not None
+            else:
+                matched = ptn_input == input
+
+            record('destination', port.name, input, ptn_input, matched, pair)
+
+            if matched:
+                return True
+
+        return False
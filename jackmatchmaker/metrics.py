@@ -0,0 +1,242 @@
+"""Runtime metrics with export in the Prometheus text exposition format."""
+
+import errno
+import logging
+import os
+import socket
+import socketserver
+
+from bisect import bisect_left
+
+
+log = logging.getLogger("jack-matchmaker")
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_PREFIX = "jack_matchmaker_"
+
+
+def format_labels(labels, extra=None):
+    items = list(labels)
+
+    if extra:
+        items.append(extra)
+
+    if not items:
+        return ""
+
+    return "{%s}" % ",".join('%s="%s"' % (name, str(value).replace('"', '\\"'))
+                             for name, value in items)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram(object):
+    """Cumulative histogram of observed values with fixed bucket upper bounds."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics(object):
+    """Registry of counters, gauges and histograms.
+
+    Counters and histograms are updated by the code being measured. Updating them only
+    increments numbers in a dictionary, so they are always enabled. The values of gauges and of
+    counters maintained elsewhere are retrieved from a function when the metrics are rendered.
+
+    Metric values can have labels, given as a tuple of ``(name, value)`` tuples.
+
+    """
+
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        # name -> (type, help)
+        self._meta = {}
+        # name -> {labels: value}
+        self._values = {}
+        # name -> function returning value or dict {labels: value}
+        self._funcs = {}
+
+    def _register(self, type_, name, help, func=None):
+        self._meta[name] = (type_, help)
+
+        if func is not None:
+            self._funcs[name] = func
+        else:
+            self._values[name] = {}
+
+    def counter(self, name, help, func=None):
+        self._register('counter', name, help, func)
+
+    def gauge(self, name, help, func=None):
+        self._register('gauge', name, help, func)
+
+    def histogram(self, name, help):
+        self._register('histogram', name, help)
+
+    def inc(self, name, value=1, labels=()):
+        values = self._values[name]
+        values[labels] = values.get(labels, 0) + value
+
+    def set(self, name, value, labels=()):
+        self._values[name][labels] = value
+
+    def observe(self, name, value, labels=()):
+        values = self._values[name]
+
+        try:
+            values[labels].observe(value)
+        except KeyError:
+            histogram = values[labels] = Histogram()
+            histogram.observe(value)
+
+    def get(self, name, labels=()):
+        """Return current value of metric (``None`` if it has no value yet)."""
+        if name in self._funcs:
+            value = self._funcs[name]()
+            return value.get(labels) if isinstance(value, dict) else value
+
+        return self._values[name].get(labels)
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+
+        for name, (type_, help) in sorted(self._meta.items()):
+            fullname = self.prefix + name
+            lines.append("# HELP %s %s" % (fullname, help))
+            lines.append("# TYPE %s %s" % (fullname, type_))
+
+            if name in self._funcs:
+                values = self._funcs[name]()
+
+                if not isinstance(values, dict):
+                    values = {(): values}
+            else:
+                values = self._values[name]
+
+            for labels, value in sorted(list(values.items())):
+                if type_ == 'histogram':
+                    cumulative = 0
+
+                    for bound, count in zip(value.buckets + (float('inf'),), value.counts):
+                        cumulative += count
+                        lines.append("%s_bucket%s %i" % (fullname, format_labels(
+                            labels, ('le', format_value(bound))), cumulative))
+
+                    lines.append("%s_sum%s %s" % (fullname, format_labels(labels),
+                                                  format_value(value.sum)))
+                    lines.append("%s_count%s %i" % (fullname, format_labels(labels),
+                                                    value.count))
+                else:
+                    lines.append("%s%s %s" % (fullname, format_labels(labels),
+                                              format_value(value)))
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename):
+        """Write metrics to file atomically (i.e. readers never see a partially written file)."""
+        tmpname = filename + '.tmp'
+
+        with open(tmpname, 'w') as fp:
+            fp.write(self.render())
+
+        os.replace(tmpname, filename)
+
+
+class CallCounter(object):
+    """Proxy for a module, which counts calls to its functions in a metrics counter.
+
+    Non-callable attributes of the module are returned as is.
+
+    """
+
+    def __init__(self, module, metrics, name):
+        self._module = module
+        self._metrics = metrics
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(self._module, attr)
+
+        if not callable(value):
+            return value
+
+        metrics, name, labels = self._metrics, self._name, (('function', attr),)
+
+        def wrapper(*args, **kwargs):
+            metrics.inc(name, labels=labels)
+            return value(*args, **kwargs)
+
+        # Cache wrapper, so __getattr__ is only called once per function
+        setattr(self, attr, wrapper)
+        return wrapper
+
+
+class MetricsRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.wfile.write(self.server.metrics.render().encode('utf-8'))
+
+
+class MetricsServer(socketserver.UnixStreamServer):
+    """UNIX domain socket server, which sends the current metrics to each client connecting.
+
+    E.g. ``socat - UNIX-CONNECT:/path/to/socket``.
+
+    Requests are handled by calling ``handle_request`` from the main loop, when the socket
+    (see ``fileno``) is readable. The metrics are rendered in the main loop thread, so they are
+    consistent.
+
+    """
+
+    def __init__(self, path, metrics):
+        self.metrics = metrics
+        remove_stale_socket(path)
+        super().__init__(path, MetricsRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def unix_sockets_supported():
+    return hasattr(socket, 'AF_UNIX')
+
+
+def remove_stale_socket(path):
+    """Remove socket left over at path by a process, which did not exit cleanly.
+
+    Raises ``OSError``, if another process is still accepting connections on the socket.
+
+    """
+    if not os.path.exists(path) or os.path.isfile(path):
+        return
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            pass
+        else:
+            raise OSError(errno.EADDRINUSE, "Socket is in use by another process", path)
+
+    os.unlink(path)
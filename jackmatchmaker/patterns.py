@@ -0,0 +1,624 @@
+"""Index of port pattern pairs for fast matching of port names."""
+
+import logging
+import re
+
+from collections import defaultdict, namedtuple
+from itertools import chain
+from string import Formatter
+
+from cachetools import LRUCache
+
+from .graph import (AUDIO_TYPE, MIDI_TYPE, PORT_IS_CV, PORT_IS_INPUT, PORT_IS_OUTPUT,
+                    PORT_IS_PHYSICAL, PORT_IS_TERMINAL)
+
+try:
+    from re import _parser as sre_parse  # Python >= 3.11
+except ImportError:
+    import sre_parse
+
+
+log = logging.getLogger("jack-matchmaker")
+TEMPLATE_CACHE_MAXSIZE = 1024
+# Matches global inline flags at the start of a regular expression
+INLINE_FLAGS_RX = re.compile(r"^\(\?([aiLmsux]+)\)")
+# Matches back references by number or name
+BACKREF_RX = re.compile(r"\\[1-9]|\(\?P=")
+# Matches start of named groups
+NAMED_GROUP_RX = re.compile(r"(?<!\\)\(\?P<\w+>")
+# Matches argument name part of a replacement field name
+ARG_NAME_RX = re.compile(r"[^.\[]*")
+# Matches port filter and priority given as a regex comment at the start of a pattern
+PORT_FILTER_RX = re.compile(r"^\(\?#([^)]*)\)")
+# Port filter keyword -> (port type, flags, flags mask)
+PORT_FILTER_KEYWORDS = {
+    'audio': (AUDIO_TYPE, 0, PORT_IS_CV),
+    'cv': (AUDIO_TYPE, PORT_IS_CV, PORT_IS_CV),
+    'midi': (MIDI_TYPE, 0, 0),
+    'input': (None, PORT_IS_INPUT, PORT_IS_INPUT),
+    'output': (None, PORT_IS_OUTPUT, PORT_IS_OUTPUT),
+    'physical': (None, PORT_IS_PHYSICAL, PORT_IS_PHYSICAL),
+    '!physical': (None, 0, PORT_IS_PHYSICAL),
+    'terminal': (None, PORT_IS_TERMINAL, PORT_IS_TERMINAL),
+    '!terminal': (None, 0, PORT_IS_TERMINAL),
+}
+
+PatternPair = namedtuple('PatternPair',
+                         ('output', 'input', 'source_filter', 'dest_filter', 'priority'),
+                         defaults=(None, None, 0))
+
+
+class PortFilter(namedtuple('PortFilter', ('type', 'flags', 'mask'))):
+    """Filter for ports by port type and flags.
+
+    A port passes the filter, if it has the given type (unless ``type`` is ``None``) and its
+    flags masked with ``mask`` are equal to ``flags``.
+
+    """
+
+    __slots__ = ()
+
+    def matches(self, port):
+        return ((self.type is None or port.type == self.type)
+                and port.flags & self.mask == self.flags)
+
+    def __str__(self):
+        """Return filter keywords separated by commas."""
+        keywords = [keyword for keyword, (type_, flags, mask) in PORT_FILTER_KEYWORDS.items()
+                    if type_ is None and mask & self.mask and self.flags & mask == flags]
+
+        if self.type == MIDI_TYPE:
+            keywords.insert(0, 'midi')
+        elif self.type == AUDIO_TYPE:
+            keywords.insert(0, 'cv' if self.flags & PORT_IS_CV else 'audio')
+
+        return ",".join(keywords)
+
+
+def parse_pattern_options(pattern):
+    """Split port filter and priority off the start of a pattern.
+
+    They are given as a regex comment containing keywords separated by commas or spaces, e.g.
+    ``(?#midi,physical)`` or ``(?#audio,priority=10)``. Returns a tuple of a ``PortFilter`` (or
+    ``None``), the priority (or ``None``) and the pattern without the comment. Comments
+    containing other words are not options and are kept.
+
+    """
+    match = PORT_FILTER_RX.match(pattern)
+
+    if not match:
+        return None, None, pattern
+
+    keywords = match.group(1).replace(',', ' ').split()
+    port_type, flags, mask, priority = None, 0, 0, None
+
+    for keyword in keywords:
+        if keyword in PORT_FILTER_KEYWORDS:
+            kw_type, kw_flags, kw_mask = PORT_FILTER_KEYWORDS[keyword]
+            port_type = kw_type or port_type
+            flags |= kw_flags
+            mask |= kw_mask
+            continue
+
+        name, sep, value = keyword.partition('=')
+
+        try:
+            if name != 'priority' or not sep:
+                raise ValueError
+            priority = int(value)
+        except ValueError:
+            return None, None, pattern
+
+    if not keywords:
+        return None, None, pattern
+
+    port_filter = PortFilter(port_type, flags, mask) if port_type or mask else None
+    return port_filter, priority, pattern[match.end():]
+
+
+def _with_type(port_filter, other):
+    """Return port filter with port type and control voltage flag of the other filter."""
+    cv_flags, cv_mask = other.flags & PORT_IS_CV, other.mask & PORT_IS_CV
+
+    if port_filter is None:
+        return PortFilter(other.type, cv_flags, cv_mask)
+
+    return PortFilter(other.type, port_filter.flags | cv_flags, port_filter.mask | cv_mask)
+
+
+def infer_port_filters(source_filter, dest_filter):
+    """Return source and destination port filter with port type inferred from the other filter.
+
+    Ports can only be connected to ports of the same type, so the type declared for one side of
+    a pattern pair also applies to the other.
+
+    """
+    if source_filter is not None and source_filter.type is not None:
+        if dest_filter is None or dest_filter.type is None:
+            dest_filter = _with_type(dest_filter, source_filter)
+    elif dest_filter is not None and dest_filter.type is not None:
+        source_filter = _with_type(source_filter, dest_filter)
+
+    return source_filter, dest_filter
+
+
+def compile_output_pattern(ptn_output, exact_matching=False):
+    """Return output port pattern compiled into a regex (unless it is literal).
+
+    Raises ``re.error`` if the pattern is not a valid regular expression.
+
+    """
+    if not exact_matching or (ptn_output.startswith('/') and ptn_output.endswith('/')):
+        return re.compile(ptn_output.strip('/'))
+
+    return ptn_output
+
+
+def compile_pair(ptn_output, ptn_input, exact_matching=False):
+    """Return ``PatternPair`` with compiled output port pattern and port filters.
+
+    Port filters and priority given at the start of either pattern are split off (see
+    ``parse_pattern_options``). If both patterns have a priority, the higher one applies. Raises
+    ``re.error`` if the output port pattern is not a valid regular expression.
+
+    """
+    source_filter, source_priority, ptn_output = parse_pattern_options(ptn_output)
+    dest_filter, dest_priority, ptn_input = parse_pattern_options(ptn_input)
+    source_filter, dest_filter = infer_port_filters(source_filter, dest_filter)
+    priorities = [prio for prio in (source_priority, dest_priority) if prio is not None]
+    priority = max(priorities) if priorities else 0
+    return PatternPair(compile_output_pattern(ptn_output, exact_matching), ptn_input,
+                       source_filter, dest_filter, priority)
+
+
+def read_pattern_file(filename):
+    """Return list of ``(output pattern, input pattern)`` string tuples read from file.
+
+    Empty lines and lines starting with a hash sign are ignored. Raises ``OSError`` if the file
+    can not be read.
+
+    """
+    with open(filename) as fp:
+        stripfilter = (line.strip() for line in fp)
+        lines = iter([line for line in stripfilter if line and not line.startswith('#')])
+
+    return list(zip(lines, lines))
+
+
+def literal_client_prefix(pattern):
+    """Return client name, which all port names matched by the compiled regex must start with.
+
+    Returns ``None``, if the regex does not start with a literal client name followed by a
+    colon or matches case-insensitively.
+
+    """
+    if pattern.flags & re.IGNORECASE:
+        return None
+
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return None
+
+    prefix = []
+    for op, arg in parsed:
+        if op != sre_parse.LITERAL:
+            break
+
+        char = chr(arg)
+
+        if char == ':':
+            return "".join(prefix) if prefix else None
+
+        prefix.append(char)
+
+    return None
+
+
+def template_client_prefix(template, exact_matching=False):
+    """Return client name, which all port names matched by input port pattern template must
+    start with.
+
+    Returns ``None``, if the template does not start with a literal client name followed by a
+    colon. For regex templates, this is determined like for source patterns (see
+    ``literal_client_prefix``), with each replacement field standing for any character, so
+    e.g. alternatives (``mon:in|rec:in``) or a field in the client name have no prefix.
+
+    """
+    if exact_matching and not (template.startswith('/') and template.endswith('/')):
+        client, sep, _ = template.partition(':')
+
+        if not sep or not client or any(char in '{}' for char in client):
+            return None
+
+        return client
+
+    try:
+        source = "".join(literal + ('.' if name is not None else '')
+                         for literal, name, _, _ in Formatter().parse(template.strip('/')))
+        return literal_client_prefix(re.compile(source))
+    except (ValueError, re.error):
+        return None
+
+
+def combinable(pattern):
+    """Return regex source for pattern suitable for combining it with others or ``None``.
+
+    Named groups are converted into non-capturing groups and global inline flags into scoped
+    flags. Patterns with back references are not combinable.
+
+    """
+    source = pattern.pattern
+
+    if BACKREF_RX.search(source):
+        return None
+
+    source = NAMED_GROUP_RX.sub("(?:", source)
+    match = INLINE_FLAGS_RX.match(source)
+
+    if match:
+        source = "(?%s:%s)" % (match.group(1), source[match.end():])
+
+    try:
+        re.compile(source)
+    except re.error:
+        return None
+
+    return source
+
+
+def template_fields(template):
+    """Return sorted tuple of argument names used in replacement fields of template."""
+    try:
+        return tuple(sorted({ARG_NAME_RX.match(name).group()
+                             for _, name, _, _ in Formatter().parse(template)
+                             if name is not None}))
+    except ValueError:
+        return ()
+
+
+def pattern_source(pattern, exact_matching=False):
+    """Return source string of an output port pattern as given on the command line."""
+    if isinstance(pattern, re.Pattern):
+        return "/%s/" % pattern.pattern if exact_matching else pattern.pattern
+
+    return pattern
+
+
+def pair_source(pair, exact_matching=False):
+    """Return source strings of both patterns of a pattern pair including port filters and
+    priority.
+
+    """
+    ptn_output = pattern_source(pair.output, exact_matching)
+    ptn_input = pair.input
+    options = [str(pair.source_filter)] if pair.source_filter is not None else []
+
+    if pair.priority:
+        options.append("priority=%i" % pair.priority)
+
+    if options:
+        ptn_output = "(?#%s)%s" % (",".join(options), ptn_output)
+
+    if pair.dest_filter is not None:
+        ptn_input = "(?#%s)%s" % (pair.dest_filter, ptn_input)
+
+    return ptn_output, ptn_input
+
+
+def match_pattern(pattern, name):
+    """Match port name against a single output port pattern.
+
+    Returns a match object for regexes or ``True`` for literal patterns, if the name matches,
+    and ``None`` otherwise.
+
+    """
+    if isinstance(pattern, re.Pattern):
+        return pattern.match(name)
+
+    return True if pattern == name else None
+
+
+class TemplateCache(object):
+    """Cache of input port patterns resolved from templates and source port match groups.
+
+    Resolving a template means filling in the match groups of the source port pattern match
+    into the replacement fields of the template and compiling the result into a regex (unless
+    in exact matching mode and the result is not enclosed in slashes).
+
+    Templates without replacement fields are resolved once by ``prepare`` and stay in the cache
+    until ``clear`` is called. All other resolved templates are kept in a LRU cache with
+    ``maxsize`` entries, keyed by the template and the values substituted into it.
+
+    The number of cache look-ups, which could and could not be satisfied from the cache, are
+    counted in ``hits`` resp. ``misses``.
+
+    """
+
+    def __init__(self, maxsize=TEMPLATE_CACHE_MAXSIZE, exact_matching=False):
+        self.exact_matching = exact_matching
+        self.hits = 0
+        self.misses = 0
+        self._cache = LRUCache(maxsize)
+        # template -> tuple of argument names used in replacement fields
+        self._fields = {}
+        # resolved templates without replacement fields
+        self._static = {}
+
+    @property
+    def currsize(self):
+        return self._cache.currsize
+
+    @property
+    def maxsize(self):
+        return self._cache.maxsize
+
+    def clear(self):
+        self._cache.clear()
+        self._fields.clear()
+        self._static.clear()
+
+    def prepare(self, template):
+        """Determine replacement fields of template and resolve it, if it has none."""
+        fields = self._fields[template] = template_fields(template)
+
+        if not fields:
+            self._static[(template, None)] = self._resolve(template, None)
+            self._static[(template, ())] = self._resolve(template, {})
+
+    def resolve(self, template, match):
+        """Return resolved template for match of source port pattern.
+
+        ``match`` is either a regex match object or ``True`` for literal source port patterns,
+        in which case the template is used as is.
+
+        Returns ``None`` if the resolved template is not a valid regular expression.
+
+        """
+        if isinstance(match, re.Match):
+            groups = match.groupdict()
+
+            try:
+                fields = self._fields[template]
+            except KeyError:
+                self.prepare(template)
+                fields = self._fields[template]
+
+            key = (template, tuple(groups.get(name, '') for name in fields))
+        else:
+            groups = None
+            key = (template, None)
+
+        try:
+            result = self._static[key]
+        except KeyError:
+            try:
+                result = self._cache[key]
+            except KeyError:
+                self.misses += 1
+                result = self._cache[key] = self._resolve(template, groups)
+                return result
+
+        self.hits += 1
+        return result
+
+    def _resolve(self, template, groups):
+        if groups is not None:
+            # try to fill-in groups matches from output port
+            # pattern into input port pattern
+            try:
+                resolved = template.format_map(defaultdict(str, **groups))
+            except Exception as exc:
+                log.warning("Could not merge match groups into input pattern '%s': %s",
+                            template, exc)
+                resolved = template
+        else:
+            resolved = template
+
+        if not self.exact_matching or (resolved.startswith('/') and resolved.endswith('/')):
+            try:
+                resolved = re.compile(resolved.strip('/'))
+            except re.error as exc:
+                log.error("Error in input port pattern '%s': %s", resolved, exc)
+                return None
+
+        return resolved
+
+
+class PatternIndex(object):
+    """Ordered collection of pattern pairs indexed for matching port names.
+
+    The first pattern of each pair is either a string, which must be equal to a port name, or a
+    compiled regular expression, which must match the start of a port name. The second pattern
+    of each pair is a template for the input port pattern. Pairs may also have a
+    ``PortFilter`` for the source and for the destination ports and a priority (see
+    ``parse_pattern_options``). Of the filters, the index only applies the port type of the
+    source port filter, if the type of the port is passed to ``match``, so patterns for other
+    port types are not tried at all. All other filter conditions are applied by the caller.
+
+    For matching, the pairs are sorted into three groups:
+
+    * Literal patterns are stored in a dictionary keyed by the port name.
+    * Regexes, which start with a literal client name followed by a colon, are bucketed by
+      client name, so only regexes for the client of a port name are tried.
+    * All other regexes are merged into a single regex per source port type declared by the
+      pairs (or none), with one alternative per pattern, each in a named group, which reports
+      the first pattern that matched. Only the patterns following it need to be tried
+      individually. Patterns, which can not be merged (e.g. because they contain back
+      references), are always tried individually.
+
+    The index is (re-)built lazily when pairs were added since the last match. Building it also
+    determines the set of client names, to which the port names matched by the patterns are
+    restricted by literal prefixes of the patterns (see ``could_match_client``).
+
+    The input port pattern templates are resolved via a ``TemplateCache``.
+
+    """
+
+    def __init__(self, exact_matching=False, template_cache_size=TEMPLATE_CACHE_MAXSIZE):
+        self.pairs = []
+        self.templates = TemplateCache(template_cache_size, exact_matching)
+        self.exact_matching = exact_matching
+        # incremented whenever pairs are added or removed
+        self.generation = 0
+        self._dirty = True
+
+    def __contains__(self, pair):
+        return pair in self.pairs
+
+    def __iter__(self):
+        return iter(self.pairs)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def add(self, ptn_output, ptn_input, source_filter=None, dest_filter=None, priority=0):
+        """Add pattern pair. Returns ``False`` if the pair was already in the index."""
+        pair = PatternPair(ptn_output, ptn_input, source_filter, dest_filter, priority)
+
+        if pair in self.pairs:
+            return False
+
+        self.pairs.append(pair)
+        self.templates.prepare(ptn_input)
+        self.generation += 1
+        self._dirty = True
+        return True
+
+    def remove(self, ptn_output, ptn_input, source_filter=None, dest_filter=None, priority=0):
+        """Remove pattern pair. Returns ``False`` if the pair was not in the index."""
+        try:
+            self.pairs.remove(PatternPair(ptn_output, ptn_input, source_filter, dest_filter,
+                                          priority))
+        except ValueError:
+            return False
+
+        self.generation += 1
+        self._dirty = True
+        return True
+
+    def clear(self):
+        self.pairs = []
+        self.templates.clear()
+        self.generation += 1
+        self._dirty = True
+
+    def resolve_input(self, pair, match):
+        """Return input port pattern of pair resolved for given source port pattern match."""
+        return self.templates.resolve(pair.input, match)
+
+    def build(self):
+        """Build index from pattern pairs."""
+        # port type declared by source port filter of each pair (or None)
+        self.types = [pair.source_filter.type if pair.source_filter is not None else None
+                      for pair in self.pairs]
+        # port name -> list of pair indexes
+        self.literals = {}
+        # client name -> list of (pair index, regex)
+        self.by_client = {}
+        # list of (pair index, regex) for regexes, which can not be combined
+        self.unindexed = []
+        # port type -> (combined regex, list of (pair index, regex) for regexes in it)
+        self.combined = {}
+        # client name prefixes of all patterns (None for patterns without literal prefix)
+        clients = set()
+        # port type -> list of regex sources to combine
+        sources = {}
+
+        for i, (ptn_output, ptn_input, *_) in enumerate(self.pairs):
+            clients.add(template_client_prefix(ptn_input, self.exact_matching))
+
+            if not isinstance(ptn_output, re.Pattern):
+                self.literals.setdefault(ptn_output, []).append(i)
+                client, sep, _ = ptn_output.partition(':')
+                clients.add(client if sep else None)
+                continue
+
+            client = literal_client_prefix(ptn_output)
+            clients.add(client)
+
+            if client is not None:
+                self.by_client.setdefault(client, []).append((i, ptn_output))
+                continue
+
+            source = combinable(ptn_output)
+
+            if source is None:
+                self.unindexed.append((i, ptn_output))
+            else:
+                type_sources = sources.setdefault(self.types[i], [])
+                combined_pairs = self.combined.setdefault(self.types[i], (None, []))[1]
+                type_sources.append("(?P<_%i>%s)" % (len(combined_pairs), source))
+                combined_pairs.append((i, ptn_output))
+
+        for port_type, type_sources in sources.items():
+            combined_pairs = self.combined[port_type][1]
+
+            try:
+                self.combined[port_type] = (re.compile("|".join(type_sources)), combined_pairs)
+            except (re.error, AssertionError) as exc:
+                log.debug("Could not combine source port patterns: %s", exc)
+                del self.combined[port_type]
+                self.unindexed.extend(combined_pairs)
+                self.unindexed.sort()
+
+        # names of clients, whose ports could be matched by any pattern (None = all clients)
+        self.clients = None if None in clients else clients
+        self._dirty = False
+
+    def could_match_client(self, client):
+        """Return whether any pattern could match a port name starting with given client name
+        and a colon.
+
+        """
+        if self._dirty:
+            self.build()
+
+        return self.clients is None or client in self.clients
+
+    def match(self, name, port_type=None):
+        """Match port name against first pattern of all pairs.
+
+        If ``port_type`` is given, pairs whose source port filter declares another port type are
+        skipped.
+
+        Returns a list of ``(pair, match)`` tuples in order of the pattern pairs, where ``match``
+        is a match object for regexes or ``True`` for literal patterns.
+
+        """
+        if self._dirty:
+            self.build()
+
+        types = self.types
+        result = [(i, True) for i in self.literals.get(name, ())
+                  if port_type is None or types[i] in (None, port_type)]
+        client = name.split(':', 1)[0]
+
+        for i, regex in chain(self.by_client.get(client, ()), self.unindexed):
+            if port_type is not None and types[i] not in (None, port_type):
+                continue
+
+            match = regex.match(name)
+
+            if match:
+                result.append((i, match))
+
+        for combined_type, (combined, combined_pairs) in self.combined.items():
+            if port_type is not None and combined_type not in (None, port_type):
+                continue
+
+            match = combined.match(name)
+
+            if match:
+                first = int(match.lastgroup[1:])
+
+                for i, regex in combined_pairs[first:]:
+                    match = regex.match(name)
+
+                    if match:
+                        result.append((i, match))
+
+        if len(result) > 1:
+            result.sort(key=lambda item: item[0])
+
+        return [(self.pairs[i], match) for i, match in result]
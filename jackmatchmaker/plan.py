@@ -0,0 +1,129 @@
+"""Offline evaluation of pattern pairs against a snapshot of the port graph.
+
+The connections, which jack-matchmaker would make, are computed with the same matching engine
+as used when connected to a JACK server, but without needing a JACK server or ``libjack``.
+
+"""
+
+import logging
+import re
+import sys
+import time
+
+from .listing import ListingWriter
+from .matcher import Matcher
+from .patterns import (TEMPLATE_CACHE_MAXSIZE, PatternIndex, compile_pair, match_pattern,
+                       pair_source, read_pattern_file)
+from .reconciler import Reconciler
+from .snapshot import load_snapshot
+
+
+log = logging.getLogger("jack-matchmaker")
+
+
+def make_plan(graph, patterns, match_aliases=True):
+    """Match all ports of graph against pattern pairs and return connection plan.
+
+    Returns a dictionary with the list of planned connections (``connections``), a list with a
+    dictionary of statistics for each pattern pair (``rules``) and a summary (``summary``).
+
+    The statistics contain the number of source ports matched by a pair, the number of port
+    pairs found for them (not counting those already found via another pair resolving to the
+    same input port pattern) and the time spent on the pair. Since the index matches the source
+    patterns of all pairs together, the time for the source pattern is measured separately by
+    matching it against all port names.
+
+    """
+    if not match_aliases:
+        for port in graph:
+            port.aliases = None
+
+    stats = {}
+    matcher = Matcher(patterns, graph, stats)
+    reconciler = Reconciler(graph)
+    start = time.perf_counter()
+
+    for src, dst in matcher.match_all():
+        reconciler.add(src, dst)
+
+    connections = reconciler.plan()
+    seconds = time.perf_counter() - start
+    names = [name for port in graph for name in port.names()]
+    rules = []
+
+    for pair in patterns:
+        start = time.perf_counter()
+
+        for name in names:
+            match_pattern(pair.output, name)
+
+        ptn_output, ptn_input = pair_source(pair, patterns.exact_matching)
+        rule = stats.get(pair)
+        rules.append(dict(
+            output=ptn_output,
+            input=ptn_input,
+            sources=rule.sources if rule else 0,
+            pairs=rule.pairs if rule else 0,
+            seconds=(rule.seconds if rule else 0.0) + time.perf_counter() - start
+        ))
+
+    summary = dict(ports=len(graph), pattern_pairs=len(patterns), connections=len(connections),
+                   seconds=seconds)
+    return dict(connections=connections, rules=rules, summary=summary)
+
+
+def write_plan(plan, fp, format='text'):
+    """Write connection plan in text (same format as pattern files), JSON or JSON lines."""
+    if format != 'text':
+        writer = ListingWriter(fp, format)
+        writer.write_connections(plan['connections'])
+        writer.write_records('rules', plan['rules'])
+        writer.write_records('summary', [plan['summary']])
+        writer.close()
+        return
+
+    write = fp.write
+
+    for outport, inport in plan['connections']:
+        write("%s\n    %s\n\n" % (outport, inport))
+
+    write("# sources    pairs  time [ms]  pattern pair\n")
+
+    for rule in plan['rules']:
+        write("# %7i  %7i  %9.3f  '%s' --> '%s'\n" % (rule['sources'], rule['pairs'],
+                                                     rule['seconds'] * 1000, rule['output'],
+                                                     rule['input']))
+
+    summary = plan['summary']
+    write("# %i connection(s) planned for %i port(s) and %i pattern pair(s) in %.3f ms.\n" % (
+          summary['connections'], summary['ports'], summary['pattern_pairs'],
+          summary['seconds'] * 1000))
+    fp.flush()
+
+
+def run_plan(snapshot, pairs=(), pattern_file=None, exact_matching=False, match_aliases=True,
+             template_cache_size=TEMPLATE_CACHE_MAXSIZE, format='text', fp=None):
+    """Evaluate pattern pairs and pairs from pattern file against graph snapshot file and write
+    connection plan.
+
+    The plan is written to standard output, if ``fp`` is ``None``. Returns an error message or
+    ``None`` on success.
+
+    """
+    patterns = PatternIndex(exact_matching, template_cache_size)
+
+    try:
+        graph = load_snapshot(snapshot)
+
+        if pattern_file:
+            pairs = read_pattern_file(pattern_file) + list(pairs)
+    except (OSError, ValueError) as exc:
+        return "Could not read file: %s" % exc
+
+    for ptn_output, ptn_input in pairs:
+        try:
+            patterns.add(*compile_pair(ptn_output, ptn_input, exact_matching))
+        except re.error as exc:
+            log.error("Error in output port pattern '%s': %s", ptn_output, exc)
+
+    write_plan(make_plan(graph, patterns, match_aliases), fp or sys.stdout, format)
@@ -0,0 +1,192 @@
+"""Computation of connections to make from matched port pairs and the current port graph."""
+
+
+class Reconciler(object):
+    """Desired connections and their difference to the actual connections in the graph.
+
+    The desired state is kept as the set of matched port pairs ``(source, destination)``. If the
+    source port of a pair is an output port, the connection from the source to the destination
+    port is desired. If the source port is an input port, connections from all output ports
+    connected to it to the destination port are desired.
+
+    Connections made by the client itself are put in the ``pending`` set, until the JACK server
+    reports them, so they can be told apart from connections made by other clients. Connections
+    it made only because they mirror a connection to an input port are also kept in the
+    ``mirrors`` set, so they can be removed again, when the mirrored connection is removed (see
+    ``unmirrored``).
+
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        # connections made for pairs with an input port as the source
+        self.mirrors = set()
+        self.clear()
+
+    def clear(self):
+        # source port name -> set of destination port names
+        self.matches = {}
+        # destination port name -> set of source port names
+        self.matched_by = {}
+        self.pending = set()
+
+    def add(self, src, dst):
+        """Add matched port pair. Returns ``False`` if pair was already known."""
+        dsts = self.matches.setdefault(src, set())
+
+        if dst in dsts:
+            return False
+
+        dsts.add(dst)
+        self.matched_by.setdefault(dst, set()).add(src)
+        return True
+
+    def forget(self, name, as_source=True, as_destination=True):
+        """Remove all matched pairs with given port as source and/or destination."""
+        if as_source:
+            for dst in self.matches.pop(name, ()):
+                self._discard(self.matched_by, dst, name)
+
+        if as_destination:
+            for src in self.matched_by.pop(name, ()):
+                self._discard(self.matches, src, name)
+
+    def confirm(self, src, dst):
+        """Remove connection from pending connections. Returns whether it was pending."""
+        try:
+            self.pending.remove((src, dst))
+        except KeyError:
+            return False
+
+        return True
+
+    def forget_pending(self, name):
+        """Forget pending connections from or to the given port.
+
+        Must be called when a port is unregistered, since the JACK server may never report
+        connections of a port, which vanished right after they were made.
+
+        """
+        if self.pending:
+            self.pending = {conn for conn in self.pending if name not in conn}
+
+    def forget_mirrors(self, name):
+        """Forget connections made by mirroring from or to the given port."""
+        if self.mirrors:
+            self.mirrors = {conn for conn in self.mirrors if name not in conn}
+
+    def rename_port(self, old_name, new_name):
+        """Update mirrored and pending connections from or to a renamed port."""
+        def rename(conns):
+            return {(new_name if conn[0] == old_name else conn[0],
+                     new_name if conn[1] == old_name else conn[1]) for conn in conns}
+
+        if self.mirrors:
+            self.mirrors = rename(self.mirrors)
+
+        if self.pending:
+            self.pending = rename(self.pending)
+
+    def is_desired(self, src, dst):
+        """Return whether the connection is desired for any matched port pair."""
+        if dst in self.matches.get(src, ()):
+            return True
+
+        graph = self.graph
+        return any(graph.is_connected(src, source) for source in self.matched_by.get(dst, ()))
+
+    def desired(self, pairs=None):
+        """Yield desired connections for given matched port pairs (default: all pairs)."""
+        for conn, _ in self._desired(pairs):
+            yield conn
+
+    def _desired(self, pairs=None):
+        """Yield ``(connection, pair)`` tuples of desired connections and the matched port pair
+        they are desired for.
+
+        """
+        if pairs is None:
+            pairs = ((src, dst) for src, dsts in self.matches.items() for dst in dsts)
+
+        graph = self.graph
+
+        for src, dst in pairs:
+            port = graph.get(src)
+
+            if port is None or dst not in graph:
+                continue
+
+            if port.is_input:
+                for output in graph.get_connections(src):
+                    yield ((output, dst), (src, dst))
+            else:
+                yield ((src, dst), (src, dst))
+
+    def missing(self, pairs=None):
+        """Return desired connections for given pairs, which are neither in the graph nor
+        pending.
+
+        The result is a dictionary mapping each connection to the (first) matched port pair it is
+        desired for.
+
+        """
+        graph = self.graph
+        pending = self.pending
+        missing = {}
+
+        for conn, pair in self._desired(pairs):
+            if conn not in missing and conn not in pending and not graph.is_connected(*conn):
+                missing[conn] = pair
+
+        return missing
+
+    def plan(self):
+        """Return list of all missing connections for the matched port pairs.
+
+        This includes the connections resulting from mirroring the missing connections to input
+        ports, which are sources of matched pairs, after the connections they result from. The
+        connections found in each of these steps are sorted, so the plan does not depend on the
+        iteration order of sets. The missing connections are added to the graph, as if they were
+        made.
+
+        """
+        planned = []
+        batch = self.missing()
+
+        while batch:
+            for conn in sorted(batch):
+                self.graph.connect(*conn)
+                planned.append(conn)
+
+            batch = self.missing(self.mirrored(batch))
+
+        return planned
+
+    def mirrored(self, connections):
+        """Return matched pairs, which have the input port of one of given connections as their
+        source.
+
+        """
+        return [(inport, dst)
+                for _, inport in connections
+                for dst in self.matches.get(inport, ())]
+
+    def unmirrored(self, connections):
+        """Return connections made by mirroring any of the given removed connections, which are
+        not desired anymore.
+
+        """
+        return [(outport, dst)
+                for outport, inport in connections
+                for dst in self.matches.get(inport, ())
+                if (outport, dst) in self.mirrors and not self.is_desired(outport, dst)]
+
+    @staticmethod
+    def _discard(mapping, key, value):
+        values = mapping.get(key)
+
+        if values is not None:
+            values.discard(value)
+
+            if not values:
+                del mapping[key]
@@ -0,0 +1,174 @@
+"""Scheduling of port connections with rate limiting, priorities and retries."""
+
+import heapq
+import logging
+import time
+
+from itertools import count
+
+
+log = logging.getLogger("jack-matchmaker")
+DEFAULT_CONNECT_RETRIES = 3
+DEFAULT_RETRY_INTERVAL = 0.5
+
+
+class ConnectionScheduler(object):
+    """Queue of port connections to make, ordered by priority.
+
+    Connections are made from the main loop by calling ``connect(connection)``, which must
+    return ``True`` if the connection was made (or already existed), ``False`` if making it
+    failed and ``None`` if it is not needed anymore (e.g. because a port vanished while it was
+    queued). Failed connections are retried up to ``max_retries`` times with exponential backoff
+    starting at ``retry_interval`` seconds.
+
+    Connections with a higher priority are made first. If ``window`` is set, connections are
+    collected for that many seconds after ``flush`` was called, so that all connections queued in
+    the meantime are made in order of priority. If ``rate`` is set, at most that many connections
+    are made per second, evenly spaced, since each connection causes the JACK server to re-order
+    its processing graph. With neither set, ``flush`` makes all queued connections immediately.
+
+    The number of queued connections is ``len(scheduler)``. If ``metrics`` are given, the time
+    connections waited in the queue is observed in the ``connect_queue_seconds`` histogram and
+    retries are counted in the ``connect_retries_total`` counter.
+
+    """
+
+    def __init__(self, loop, connect, rate=0, window=0, max_retries=DEFAULT_CONNECT_RETRIES,
+                 retry_interval=DEFAULT_RETRY_INTERVAL, metrics=None):
+        self.loop = loop
+        self.connect = connect
+        self.rate = rate
+        self.window = window
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        self.metrics = metrics
+        self._seq = count()
+        self._timer = None
+        # earliest time the next connection may be made, if rate is limited
+        self._next_time = 0.0
+        self.clear()
+
+    def __len__(self):
+        return len(self._queued)
+
+    def clear(self):
+        """Drop all queued connections."""
+        # connection -> [priority, time queued, number of failed attempts]
+        self._queued = {}
+        # heap of (negative priority, sequence number, connection)
+        self._queue = []
+        # heap of (time of next attempt, sequence number, connection) of failed connections
+        self._retries = []
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def submit(self, connection, priority=0):
+        """Queue connection. If it is already queued, its priority is raised, if lower."""
+        entry = self._queued.get(connection)
+
+        if entry is None:
+            entry = self._queued[connection] = [priority, time.monotonic(), 0]
+        elif priority > entry[0]:
+            # the heap item with the lower priority is skipped when it comes up
+            entry[0] = priority
+        else:
+            return
+
+        heapq.heappush(self._queue, (-priority, next(self._seq), connection))
+
+    def flush(self):
+        """Make queued connections now, as far as the rate limit allows, or schedule making them.
+
+        Returns the number of connections made immediately.
+
+        """
+        if not self._queue:
+            return 0
+
+        when = time.monotonic() + self.window
+
+        if self._timer is not None:
+            if self._timer.when <= when:
+                return 0
+
+            self._timer.cancel()
+            self._timer = None
+
+        if self.window:
+            self._timer = self.loop.call_at(when, self._run)
+            return 0
+
+        return self._run()
+
+    def _run(self):
+        self._timer = None
+        queue, retries, queued = self._queue, self._retries, self._queued
+        now = time.monotonic()
+        made = 0
+
+        while retries and retries[0][0] <= now:
+            _, _, connection = heapq.heappop(retries)
+            entry = queued.get(connection)
+
+            if entry is not None:
+                heapq.heappush(queue, (-entry[0], next(self._seq), connection))
+
+        while queue and not (self.rate and now < self._next_time):
+            priority, _, connection = heapq.heappop(queue)
+            entry = queued.get(connection)
+
+            if entry is None or entry[0] != -priority:
+                continue
+
+            del queued[connection]
+
+            if self.metrics is not None:
+                self.metrics.observe('connect_queue_seconds', now - entry[1])
+
+            result = self.connect(connection)
+
+            if result:
+                made += 1
+            elif result is False:
+                self._retry(connection, entry, now)
+
+            if self.rate and result is not None:
+                self._next_time = max(now, self._next_time) + 1.0 / self.rate
+
+            now = time.monotonic()
+
+        self._schedule()
+        return made
+
+    def _retry(self, connection, entry, now):
+        if entry[2] >= self.max_retries:
+            log.warning("Giving up connecting ports '%s' --> '%s' after %i attempts.",
+                        connection[0], connection[1], entry[2] + 1)
+            return
+
+        entry[2] += 1
+        delay = self.retry_interval * 2 ** (entry[2] - 1)
+        log.debug("Retrying to connect ports '%s' --> '%s' in %.2f seconds.",
+                  connection[0], connection[1], delay)
+        self._queued[connection] = entry
+        heapq.heappush(self._retries, (now + delay, next(self._seq), connection))
+
+        if self.metrics is not None:
+            self.metrics.inc('connect_retries_total')
+
+    def _schedule(self):
+        """Set timer for making the next queued or retried connection."""
+        if self._queue:
+            when = self._next_time
+        elif self._retries:
+            when = self._retries[0][0]
+        else:
+            return
+
+        if self._timer is None or self._timer.when > when:
+            if self._timer is not None:
+                self._timer.cancel()
+
+            self._timer = self.loop.call_at(when, self._run)
@@ -0,0 +1,88 @@
+"""Snapshots of the port graph for evaluating patterns offline.
+
+A snapshot has the same format as the JSON or JSON lines listing of all output ports, input
+ports and connections with aliases and pretty names (i.e. ``jack-matchmaker -oican --format
+json``), so it can be created with or without a running jack-matchmaker process.
+
+"""
+
+import json
+
+from .graph import Graph, Port
+from .listing import port_record
+
+
+SECTIONS = ('outputs', 'inputs', 'connections')
+
+
+def graph_snapshot(graph):
+    """Return snapshot of graph as a dictionary, which can be serialized to JSON."""
+    return dict(
+        outputs=[port_record(port) for port in graph.outputs()],
+        inputs=[port_record(port) for port in graph.inputs()],
+        connections=[dict(output=src, input=dst)
+                     for src, dsts in graph.connections.items() for dst in sorted(dsts)]
+    )
+
+
+def _record_port(record):
+    return Port(record['name'], flags=record.get('flags', 0), type=record.get('type'),
+                aliases=record.get('aliases'), pretty_name=record.get('pretty_name'),
+                uuid=record.get('uuid'))
+
+
+def _parse_json_lines(data):
+    snapshot = dict(outputs=[], inputs=[], connections=[])
+    records = 0
+
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+
+        record = json.loads(line)
+
+        if not isinstance(record, dict) or 'kind' not in record:
+            raise ValueError("Invalid graph snapshot: record without 'kind' key: %s" % line)
+
+        snapshot.setdefault(record.pop('kind') + 's', []).append(record)
+        records += 1
+
+    if not records:
+        raise ValueError("Invalid graph snapshot: neither JSON object with sections %s nor JSON "
+                         "lines records." % ", ".join(SECTIONS))
+
+    return snapshot
+
+
+def load_snapshot(filename):
+    """Read snapshot in JSON or JSON lines format from file and return new graph model.
+
+    Raises ``OSError`` if the file can not be read and ``ValueError`` if it is not a valid
+    snapshot.
+
+    """
+    with open(filename) as fp:
+        data = fp.read()
+
+    try:
+        snapshot = json.loads(data)
+    except ValueError:
+        snapshot = None
+
+    # A JSON lines snapshot with a single record is also a valid JSON document
+    if (not isinstance(snapshot, dict) or 'kind' in snapshot
+            or not any(section in snapshot for section in SECTIONS)):
+        snapshot = _parse_json_lines(data)
+
+    graph = Graph()
+
+    try:
+        for record in snapshot.get('outputs', []) + snapshot.get('inputs', []):
+            graph.add(_record_port(record))
+
+        for record in snapshot.get('connections', []):
+            graph.connect(record['output'], record['input'])
+    except (AttributeError, KeyError, TypeError) as exc:
+        raise ValueError("Invalid graph snapshot: %r" % exc)
+
+    return graph
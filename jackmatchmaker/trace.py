@@ -0,0 +1,86 @@
+"""Sampled in-memory tracing of pattern match decisions."""
+
+import time
+
+from collections import deque, namedtuple
+
+
+DEFAULT_TRACE_SIZE = 1000
+
+# A single match decision:
+# - kind: 'source' or 'destination'
+# - port: name of the port being matched
+# - name: port name, alias or pretty name tested
+# - pattern: output port pattern (source) or resolved input port pattern (destination), either
+#   a compiled regex or a string, or ``None`` if a port matched no source pattern at all
+# - matched: whether the pattern matched or ``None``, if the source pattern matched, but the port
+#   did not pass the source port filter of the pair
+TraceRecord = namedtuple('TraceRecord', ('time', 'kind', 'port', 'name', 'pattern', 'matched'))
+
+
+def _pattern_source(pattern):
+    return getattr(pattern, 'pattern', pattern)
+
+
+def format_record(record):
+    """Return trace record (as returned by ``MatchTracer.dump``) formatted as a line of text."""
+    timestamp = "%s.%03i" % (time.strftime("%H:%M:%S", time.localtime(record['time'])),
+                             record['time'] * 1000 % 1000)
+
+    if record['pattern'] is None:
+        return "%s %-11s %s: '%s' matches no source pattern" % (
+            timestamp, record['kind'], record['port'], record['name'])
+
+    if record['matched'] is None:
+        result = "matches '%s', but the port is rejected by its port filter"
+    else:
+        result = "matches '%s'" if record['matched'] else "does not match '%s'"
+
+    return "%s %-11s %s: '%s' %s" % (timestamp, record['kind'], record['port'], record['name'],
+                                    result % record['pattern'])
+
+
+class MatchTracer(object):
+    """Fixed-size ring buffer of recent match decisions.
+
+    Only the most recent ``size`` decisions are kept. If ``sample`` is greater than one, only
+    every ``sample``-th source and destination decision for each pattern pair (``rule``) is
+    recorded, so that pairs, which are tested rarely, are still represented in the buffer.
+    Decisions without a pair (ports matching no source pattern) are sampled together.
+
+    Recording a decision only appends a tuple to the buffer. Patterns are only converted to
+    strings when the buffer is dumped.
+
+    """
+
+    def __init__(self, size=DEFAULT_TRACE_SIZE, sample=1):
+        self.records = deque(maxlen=size)
+        self.sample = sample
+        self.total = 0
+        # (kind, pattern pair) -> number of decisions, if sampling
+        self._counts = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def clear(self):
+        self.records.clear()
+        self._counts.clear()
+
+    def record(self, kind, port, name, pattern, matched, rule=None):
+        self.total += 1
+
+        if self.sample > 1:
+            key = (kind, rule)
+            num = self._counts.get(key, 0)
+            self._counts[key] = num + 1
+
+            if num % self.sample:
+                return
+
+        self.records.append(TraceRecord(time.time(), kind, port, name, pattern, matched))
+
+    def dump(self):
+        """Return list of recorded decisions as dictionaries, oldest first."""
+        return [dict(rec._asdict(), pattern=_pattern_source(rec.pattern))
+                for rec in self.records]
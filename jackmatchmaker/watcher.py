@@ -0,0 +1,129 @@
+"""Watching a file for changes with inotify or, where not available, by polling."""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+
+
+log = logging.getLogger("jack-matchmaker")
+DEFAULT_POLL_INTERVAL = 2.0
+
+# inotify event masks (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def _load_inotify():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        return libc.inotify_init1, libc.inotify_add_watch
+    except (OSError, AttributeError, TypeError):
+        return None
+
+
+class FileWatcher(object):
+    """Call a function whenever a file was changed.
+
+    On Linux, the directory containing the file is watched with inotify for the file being
+    written and closed or being replaced by another file (as many editors do when saving).
+    ``open`` returns the inotify file descriptor, and ``read_events`` must be called, when it is
+    readable.
+
+    On other systems or if inotify is not available, ``open`` returns ``None`` and ``check``
+    must be called every ``poll_interval`` seconds to compare the modification time, size and
+    inode of the file with those seen before.
+
+    """
+
+    def __init__(self, filename, callback, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.filename = os.path.realpath(filename)
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.fd = None
+        self._last_stat = None
+
+    def open(self):
+        self.fd = self._init_inotify()
+
+        if self.fd is None:
+            log.debug("Polling pattern file '%s' every %.1f seconds for changes.",
+                      self.filename, self.poll_interval)
+            self._last_stat = self._stat()
+        else:
+            log.debug("Watching pattern file '%s' for changes with inotify.", self.filename)
+
+        return self.fd
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _init_inotify(self):
+        funcs = _load_inotify()
+
+        if funcs is None:
+            return None
+
+        inotify_init1, inotify_add_watch = funcs
+        fd = inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+
+        if fd < 0:
+            log.debug("Could not initialize inotify: %s", os.strerror(ctypes.get_errno()))
+            return None
+
+        dirname = os.path.dirname(self.filename).encode()
+
+        if inotify_add_watch(fd, dirname, IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            log.debug("Could not watch directory '%s': %s", dirname.decode(),
+                      os.strerror(ctypes.get_errno()))
+            os.close(fd)
+            return None
+
+        return fd
+
+    def read_events(self):
+        """Read pending inotify events and call callback, if any of them concerns the file."""
+        basename = os.path.basename(self.filename).encode()
+        changed = False
+
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+
+        offset = 0
+
+        while offset < len(data):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            # Only IN_CLOSE_WRITE and IN_MOVED_TO events are watched for
+            if mask & IN_Q_OVERFLOW or name == basename:
+                changed = True
+
+        if changed:
+            self.callback()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            return None
+
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def check(self):
+        """Call callback, if file changed since the last check."""
+        current = self._stat()
+
+        if current is not None and current != self._last_stat:
+            self.callback()
+
+        self._last_stat = current
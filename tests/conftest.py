@@ -0,0 +1,20 @@
+"""Run the tests against the simulated JACK server in ``benchmarks/fakejack``."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'benchmarks',
+                                'fakejack'))
+
+import jacklib  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    """Return the simulated JACK server, reset to an empty graph."""
+    jacklib.server.reset()
+    jacklib.server.calls.clear()
+    yield jacklib.server
+    jacklib.server.reset()
@@ -0,0 +1,24 @@
+"""Tests for command line argument validation."""
+
+import pytest
+
+from jackmatchmaker import main
+
+
+@pytest.mark.parametrize('args', [
+    ['--trace', '-1'],
+    ['--trace-sample', '0'],
+    ['--template-cache-size', '0'],
+    ['--template-cache-size', 'x'],
+    ['--metrics-interval', '0'],
+    ['--metrics-interval', '-1'],
+    ['--watch-interval', '0'],
+    ['--connect-retries', '2.5'],
+    ['--connect-retries', '-1'],
+])
+def test_rejects_invalid_numbers(args, capsys):
+    with pytest.raises(SystemExit) as exc:
+        main(args + ['a:out', 'b:in'])
+
+    assert exc.value.code == 2
+    assert args[0] in capsys.readouterr().err
@@ -0,0 +1,52 @@
+"""Tests for the control socket."""
+
+import os
+import socket
+import threading
+
+import pytest
+
+from jackmatchmaker.control import ControlServer, default_control_socket, send_request
+from jackmatchmaker.metrics import Metrics, MetricsServer
+
+
+def test_refuses_socket_in_use(tmp_path):
+    path = str(tmp_path / 'ctl.sock')
+    server = ControlServer(path, lambda request: request.reply(ok=True))
+
+    try:
+        with pytest.raises(OSError):
+            ControlServer(path, lambda request: None)
+
+        with pytest.raises(OSError):
+            MetricsServer(path, Metrics())
+
+        assert os.path.exists(path)
+    finally:
+        server.server_close()
+
+
+def test_replaces_stale_socket(tmp_path):
+    path = str(tmp_path / 'ctl.sock')
+    # socket left over by a process, which was killed
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.close()
+
+    server = ControlServer(path, lambda request: request.reply(ok=True, pairs=[]))
+
+    try:
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+        assert send_request(path, 'list') == dict(ok=True, pairs=[])
+        thread.join()
+    finally:
+        server.server_close()
+
+    assert not os.path.exists(path)
+
+
+def test_default_control_socket_includes_client_name(monkeypatch):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', '/run/user/1000')
+    assert default_control_socket() == '/run/user/1000/jack-matchmaker.sock'
+    assert default_control_socket('mm2') == '/run/user/1000/mm2.sock'
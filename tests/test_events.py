@@ -0,0 +1,75 @@
+"""Tests for the event queue."""
+
+from collections import deque
+
+from jackmatchmaker.events import DUMP_METRICS, PORT_REGISTERED, Event, EventQueue, PortChanges
+
+
+class InterruptingDeque(deque):
+    """Puts an event on the queue while being iterated, like a signal handler would."""
+
+    def __init__(self, queue, event, *args):
+        super().__init__(*args)
+        self.queue = queue
+        self.event = event
+
+    def __iter__(self):
+        items = list(deque.__iter__(self))
+
+        if self.event is not None:
+            event, self.event = self.event, None
+            self.queue.put(event)
+
+        return iter(items)
+
+
+def test_get_all_does_not_lose_event_put_by_signal_handler():
+    queue = EventQueue()
+
+    try:
+        queue.put(Event(PORT_REGISTERED, 1))
+        queue._events = InterruptingDeque(queue, Event(DUMP_METRICS), queue._events)
+        events = queue.get_all()
+        events.extend(queue.get_all())
+        assert [event.type for event in events] == [PORT_REGISTERED, DUMP_METRICS]
+    finally:
+        queue.close()
+
+
+def test_reset_keeps_control_events():
+    queue = EventQueue(maxsize=2)
+
+    try:
+        queue.put(Event(PORT_REGISTERED, 1))
+        queue.put(Event(DUMP_METRICS))
+        queue.put(Event(PORT_REGISTERED, 2))
+        assert queue.overflowed
+        assert queue.reset() == 1
+        assert not queue.overflowed
+        assert [event.type for event in queue.get_all()] == [DUMP_METRICS]
+    finally:
+        queue.close()
+
+
+def test_port_changes_are_merged():
+    changes = PortChanges()
+    assert not changes
+    changes.mark_port('a:out', as_destination=False)
+    changes.mark_port('b:in')
+    changes.mark_port('a:out', as_source=False)
+    assert changes.pop() == (False, {'a:out': (True, True), 'b:in': (True, True)})
+    assert not changes
+
+
+def test_port_forgotten_and_registered_again_is_re_evaluated():
+    changes = PortChanges()
+    changes.mark_port('a:out')
+    changes.forget_port('a:out')
+    changes.mark_port('b:out')
+    assert list(changes.pop()[1].items()) == [('a:out', PortChanges.FORGET),
+                                             ('b:out', (True, True))]
+
+    changes.forget_port('a:out')
+    changes.mark_port('a:out')
+    changes.mark_full_refresh()
+    assert changes.pop() == (True, {'a:out': (True, True)})
@@ -0,0 +1,61 @@
+"""Tests for listing ports and connections."""
+
+import json
+
+import jacklib
+
+from jackmatchmaker import main
+
+
+def populate(server):
+    server.register_port('synth:out', aliases=['alsa:synth'], pretty_name='Synth')
+    server.register_port('rec:in', flags=jacklib.JackPortIsInput)
+    server.connect('synth:out', 'rec:in')
+
+
+def test_connections_only_retrieved_when_listed(server, capsys):
+    populate(server)
+    main(['-o', '-i'])
+    assert server.calls['port_get_all_connections'] == 0
+    assert capsys.readouterr().out == "synth:out\n\nrec:in\n\n"
+
+    main(['-c'])
+    assert server.calls['port_get_all_connections'] == 1
+    assert capsys.readouterr().out == "synth:out\n    rec:in\n\n"
+
+
+def test_text_listing_with_aliases_and_pretty_names(server, capsys):
+    populate(server)
+    main(['-o', '-a', '-n'])
+    assert capsys.readouterr().out == "synth:out\n    alsa:synth\n    synth:Synth\n\n"
+
+
+def test_json_listing(server, capsys):
+    populate(server)
+    main(['-o', '-i', '-c', '-a', '-n', '--format', 'json'])
+    listing = json.loads(capsys.readouterr().out)
+    assert [port['name'] for port in listing['outputs']] == ['synth:out']
+    assert listing['outputs'][0]['aliases'] == ['alsa:synth']
+    assert listing['outputs'][0]['pretty_name'] == 'Synth'
+    assert listing['outputs'][0]['flags'] & jacklib.JackPortIsOutput
+    assert [port['name'] for port in listing['inputs']] == ['rec:in']
+    assert listing['connections'] == [dict(output='synth:out', input='rec:in')]
+
+
+def test_json_lines_listing(server, capsys):
+    populate(server)
+    main(['-o', '-c', '--format', 'jsonl'])
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(record['kind'], record.get('name')) for record in records] == [
+        ('output', 'synth:out'), ('connection', None)]
+    assert 'aliases' not in records[0] and 'pretty_name' not in records[0]
+    assert records[1] == dict(kind='connection', output='synth:out', input='rec:in')
+
+
+def test_connection_filter(server, capsys):
+    populate(server)
+    server.register_port('other:out')
+    server.register_port('mon:in', flags=jacklib.JackPortIsInput)
+    server.connect('other:out', 'mon:in')
+    main(['-c', 'mon'])
+    assert capsys.readouterr().out == "other:out\n    mon:in\n\n"
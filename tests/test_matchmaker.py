@@ -0,0 +1,175 @@
+"""End-to-end tests of jack-matchmaker against the simulated JACK server."""
+
+import pytest
+
+import jacklib
+
+from jackmatchmaker import JackMatchmaker
+from jackmatchmaker.control import ControlRequest
+
+
+@pytest.fixture
+def make_matchmaker(server):
+    """Return function creating a connected and activated ``JackMatchmaker``.
+
+    Events are processed synchronously by calling ``process`` on the returned instance.
+
+    """
+    instances = []
+
+    def make(patterns, **kwargs):
+        kwargs.setdefault('debounce', 0)
+        matchmaker = JackMatchmaker(patterns, **kwargs)
+        matchmaker.connect()
+        matchmaker._activate()
+        matchmaker._reconcile(matchmaker._refresh(full=True))
+
+        def process():
+            while len(matchmaker.events):
+                matchmaker._process_events()
+
+        matchmaker.process = process
+        instances.append(matchmaker)
+        return matchmaker
+
+    yield make
+
+    for matchmaker in instances:
+        matchmaker.close()
+
+
+def test_connects_existing_and_new_ports(server, make_matchmaker):
+    server.register_port('synth:out_1')
+    server.register_port('system:playback_1', flags=jacklib.JackPortIsInput)
+    mm = make_matchmaker([(r'synth:out_(?P<n>\d)', 'system:playback_{n}')])
+    assert server.connections == {('synth:out_1', 'system:playback_1')}
+
+    server.register_port('system:playback_2', flags=jacklib.JackPortIsInput)
+    server.register_port('synth:out_2')
+    mm.process()
+    assert server.connections == {('synth:out_1', 'system:playback_1'),
+                                  ('synth:out_2', 'system:playback_2')}
+
+
+def test_port_types_and_filters(server, make_matchmaker):
+    midi = jacklib.JACK_DEFAULT_MIDI_TYPE
+    server.register_port('system:capture_1',
+                         flags=jacklib.JackPortIsOutput | jacklib.JackPortIsPhysical)
+    server.register_port('system:midi_capture_1', type=midi,
+                         flags=jacklib.JackPortIsOutput | jacklib.JackPortIsPhysical)
+    server.register_port('rec:in', flags=jacklib.JackPortIsInput)
+    server.register_port('rec:midi_in', type=midi, flags=jacklib.JackPortIsInput)
+    make_matchmaker([('(?#midi,physical,output)system:.*', 'rec:.*')])
+    assert server.connections == {('system:midi_capture_1', 'rec:midi_in')}
+
+
+def test_mirrors_connections_to_input_source(server, make_matchmaker):
+    for name in ('mixer:in', 'rec:in'):
+        server.register_port(name, flags=jacklib.JackPortIsInput)
+
+    server.register_port('other:out')
+    mm = make_matchmaker([('mixer:in', 'rec:in')])
+    server.connect('other:out', 'mixer:in')
+    mm.process()
+    assert ('other:out', 'rec:in') in server.connections
+
+
+def test_reconnects_port_unregistered_while_connection_pending(server, make_matchmaker,
+                                                                monkeypatch):
+    server.register_port('synth:out')
+    server.register_port('rec:in', flags=jacklib.JackPortIsInput)
+    # the server accepts the connection, but the port vanishes before it is reported
+    monkeypatch.setattr(server, 'connect', lambda src, dst: 0)
+    mm = make_matchmaker([('synth:out', 'rec:in')])
+    assert ('synth:out', 'rec:in') in mm.reconciler.pending
+    monkeypatch.undo()
+
+    server.unregister_port('rec:in')
+    mm.process()
+    assert not mm.reconciler.pending
+
+    server.register_port('rec:in', flags=jacklib.JackPortIsInput)
+    mm.process()
+    assert server.connections == {('synth:out', 'rec:in')}
+
+
+def test_pair_added_at_runtime_matches_pretty_name(server, make_matchmaker):
+    server.register_port('synth:out_1', pretty_name='Left')
+    server.register_port('mon:in', flags=jacklib.JackPortIsInput)
+    mm = make_matchmaker([('system:capture_1', 'system:playback_1')])
+    assert not server.connections
+
+    request = ControlRequest('add', [('synth:Left', 'mon:in')])
+    mm._handle_control_request(request)
+    assert request.response == dict(ok=True, changed=1)
+    mm._reconcile(mm._refresh())
+    assert server.connections == {('synth:out_1', 'mon:in')}
+
+
+def test_unmirrors_after_rename(server, make_matchmaker):
+    for name in ('mixer:in', 'rec:in'):
+        server.register_port(name, flags=jacklib.JackPortIsInput)
+
+    server.register_port('other:out')
+    mm = make_matchmaker([('mixer:in', 'rec:in')], unmirror=True)
+    server.connect('other:out', 'mixer:in')
+    mm.process()
+    assert ('other:out', 'rec:in') in server.connections
+
+    server.rename_port('other:out', 'other:main_out')
+    mm.process()
+    assert mm.reconciler.mirrors == {('other:main_out', 'rec:in')}
+
+    server.disconnect('other:main_out', 'mixer:in')
+    mm.process()
+    assert server.connections == set()
+
+
+def test_snapshot_includes_aliases_and_all_pretty_names(server, make_matchmaker):
+    server.register_port('synth:out', aliases=['alsa:synth'], pretty_name='Synth')
+    server.register_port('rec:in', flags=jacklib.JackPortIsInput, pretty_name='Recorder')
+    mm = make_matchmaker([('system:capture_1', 'system:playback_1')], match_aliases=False)
+    request = ControlRequest('snapshot')
+    mm._handle_control_request(request)
+    snapshot = request.response['snapshot']
+    assert snapshot['outputs'][0]['aliases'] == ['alsa:synth']
+    assert snapshot['outputs'][0]['pretty_name'] == 'Synth'
+    assert snapshot['inputs'][0]['pretty_name'] == 'Recorder'
+
+
+def test_template_alternative_matches_pretty_name(server, make_matchmaker):
+    server.register_port('synth:out')
+    server.register_port('rec:in_1', flags=jacklib.JackPortIsInput, pretty_name='Main In')
+    make_matchmaker([('synth:out', 'mon:in|rec:Main In')])
+    assert server.connections == {('synth:out', 'rec:in_1')}
+
+
+def test_events_within_debounce_interval_are_processed_together(server, make_matchmaker,
+                                                                 monkeypatch):
+    mm = make_matchmaker([('synth:out_(?P<n>\\d)', 'rec:in_{n}')], debounce=0.05)
+    delays = []
+    monkeypatch.setattr(mm.loop, 'call_later',
+                        lambda delay, callback, *args: delays.append(delay) or object())
+    matched = []
+    match_source = mm.matcher.match_source
+    monkeypatch.setattr(mm.matcher, 'match_source',
+                        lambda port: matched.append(port.name) or match_source(port))
+
+    for i in range(3):
+        server.register_port('rec:in_%i' % i, flags=jacklib.JackPortIsInput)
+        server.register_port('synth:out_%i' % i)
+        mm._events_pending()
+
+    server.rename_port('synth:out_0', 'synth:out_5')
+    server.unregister_port('synth:out_1')
+    server.register_port('synth:out_1')
+    server.set_pretty_name('synth:out_1', 'One')
+    mm._events_pending()
+    # only one timer is set for the whole burst
+    assert delays == [0.05]
+
+    mm._process_pending()
+    # each changed port is matched once, under its final name
+    assert sorted(matched) == ['rec:in_0', 'rec:in_1', 'rec:in_2', 'synth:out_1', 'synth:out_2',
+                               'synth:out_5']
+    assert server.connections == {('synth:out_1', 'rec:in_1'), ('synth:out_2', 'rec:in_2')}
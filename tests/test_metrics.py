@@ -0,0 +1,93 @@
+"""Tests for runtime metrics and their export."""
+
+import socket
+import threading
+
+from jackmatchmaker.metrics import CallCounter, Histogram, Metrics, MetricsServer
+
+
+def make_metrics():
+    metrics = Metrics()
+    metrics.counter('events_total', "Events processed.")
+    metrics.gauge('queue_depth', "Queue depth.", lambda: 3)
+    metrics.histogram('latency_seconds', "Latency.")
+    return metrics
+
+
+def test_render_prometheus_text_format():
+    metrics = make_metrics()
+    metrics.inc('events_total', labels=(('type', 'registered'),))
+    metrics.inc('events_total', 2, labels=(('type', 'connected'),))
+    metrics.observe('latency_seconds', 0.003)
+    metrics.observe('latency_seconds', 20)
+    lines = metrics.render().splitlines()
+
+    assert lines[:4] == [
+        '# HELP jack_matchmaker_events_total Events processed.',
+        '# TYPE jack_matchmaker_events_total counter',
+        'jack_matchmaker_events_total{type="connected"} 2',
+        'jack_matchmaker_events_total{type="registered"} 1',
+    ]
+    assert '# TYPE jack_matchmaker_latency_seconds histogram' in lines
+    assert 'jack_matchmaker_latency_seconds_bucket{le="0.0025"} 0' in lines
+    assert 'jack_matchmaker_latency_seconds_bucket{le="0.005"} 1' in lines
+    assert 'jack_matchmaker_latency_seconds_bucket{le="10.0"} 1' in lines
+    assert 'jack_matchmaker_latency_seconds_bucket{le="+Inf"} 2' in lines
+    assert 'jack_matchmaker_latency_seconds_sum 20.003' in lines
+    assert 'jack_matchmaker_latency_seconds_count 2' in lines
+    assert lines[-1] == 'jack_matchmaker_queue_depth 3'
+
+
+def test_histogram_bucket_bounds_are_inclusive():
+    histogram = Histogram(buckets=(1, 2))
+    histogram.observe(1)
+    histogram.observe(1.5)
+    histogram.observe(3)
+    assert histogram.counts == [1, 1, 1]
+
+
+def test_call_counter_counts_calls():
+    class Module(object):
+        VALUE = 42
+
+        @staticmethod
+        def func(x):
+            return x * 2
+
+    metrics = Metrics()
+    metrics.counter('calls_total', "Calls.")
+    proxy = CallCounter(Module, metrics, 'calls_total')
+    assert proxy.func(2) == 4
+    assert proxy.func(3) == 6
+    assert proxy.VALUE == 42
+    assert metrics.get('calls_total', (('function', 'func'),)) == 2
+
+
+def test_write_metrics_file(tmp_path):
+    metrics = make_metrics()
+    filename = str(tmp_path / 'metrics.prom')
+    metrics.write(filename)
+
+    with open(filename) as fp:
+        assert fp.read() == metrics.render()
+
+
+def test_metrics_server_sends_metrics(tmp_path):
+    metrics = make_metrics()
+    path = str(tmp_path / 'metrics.sock')
+    server = MetricsServer(path, metrics)
+
+    try:
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(5)
+            sock.connect(path)
+            data = b''.join(iter(lambda: sock.recv(4096), b''))
+
+        thread.join()
+    finally:
+        server.server_close()
+
+    assert data.decode('utf-8') == metrics.render()
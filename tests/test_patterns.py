@@ -0,0 +1,165 @@
+"""Tests for the pattern index and the input port pattern template cache."""
+
+import re
+
+import pytest
+
+from jackmatchmaker.graph import AUDIO_TYPE, MIDI_TYPE
+from jackmatchmaker.patterns import (PatternIndex, TemplateCache, compile_pair,
+                                     template_client_prefix)
+
+
+PATTERNS = [
+    r"system:capture_\d+",
+    r"system:capture_1$",
+    r"synth:out_(?P<ch>[lr])$",
+    r"(?i).*:midi_out",
+    r"[ab]:out_\d",
+    r".*:monitor_(\d)",
+    r"(a|b):out_(\d)",
+    r"(?P<x>\w+):(?P=x)",
+    r"client\d+:out_1",
+    r"synth:",
+]
+NAMES = [
+    "system:capture_1", "system:capture_12", "system:capture_x", "synth:out_l", "synth:out_r",
+    "synth:out_lr", "foo:MIDI_OUT_1", "a:out_1", "b:out_9", "c:out_1", "x:monitor_3",
+    "mon:mon", "client12:out_1", "client12:out_2", "synthx:out_l",
+]
+
+
+def naive_match(pairs, name):
+    result = []
+
+    for pair in pairs:
+        match = re.match(pair.output, name) if isinstance(pair.output, re.Pattern) else (
+            pair.output == name or None)
+
+        if match:
+            result.append((pair, match))
+
+    return result
+
+
+@pytest.mark.parametrize('exact_matching', [False, True])
+def test_index_matches_like_naive_re_match(exact_matching):
+    index = PatternIndex(exact_matching)
+
+    for i, ptn in enumerate(PATTERNS + ["synth:out_l", "/system:capture_(1|2)/"]):
+        index.add(*compile_pair(ptn, "dst:in_%i" % i, exact_matching))
+
+    for name in NAMES:
+        expected = naive_match(index.pairs, name)
+        result = index.match(name)
+        assert [pair for pair, _ in result] == [pair for pair, _ in expected], name
+
+        for (_, match), (_, expected_match) in zip(result, expected):
+            if isinstance(expected_match, re.Match):
+                assert match.group(0) == expected_match.group(0)
+                assert match.groupdict() == expected_match.groupdict()
+            else:
+                assert match is True
+
+
+def test_index_rebuilds_after_add_and_remove():
+    index = PatternIndex()
+    pair = compile_pair("synth:out_1", "system:playback_1")
+    index.add(*pair)
+    assert [p for p, _ in index.match("synth:out_1")] == [pair]
+    generation = index.generation
+
+    assert index.remove(*pair)
+    assert index.generation > generation
+    assert index.match("synth:out_1") == []
+    assert not index.remove(*pair)
+
+
+def test_index_skips_pairs_for_other_port_types():
+    index = PatternIndex()
+    pairs = [compile_pair(ptn, "dst:in") for ptn in (
+        "(?#midi).*:out", "(?#audio).*:out", ".*:out", "(?#midi)synth:out", "(?#audio)synth:out",
+        "(?#midi)(?P<c>a|b):(?P=c)?out")]
+
+    for pair in pairs:
+        index.add(*pair)
+
+    assert [p for p, _ in index.match("synth:out")] == pairs[:5]
+    assert [p for p, _ in index.match("synth:out", MIDI_TYPE)] == [pairs[0], pairs[2], pairs[3]]
+    assert [p for p, _ in index.match("synth:out", AUDIO_TYPE)] == [pairs[1], pairs[2], pairs[4]]
+    assert [p for p, _ in index.match("a:out", AUDIO_TYPE)] == [pairs[1], pairs[2]]
+    assert [p for p, _ in index.match("a:out", MIDI_TYPE)] == [pairs[0], pairs[2], pairs[5]]
+
+
+def test_could_match_client():
+    index = PatternIndex()
+    index.add(*compile_pair("synth:out_1", "system:playback_1"))
+    assert index.could_match_client("synth")
+    assert index.could_match_client("system")
+    assert not index.could_match_client("other")
+
+    index.add(*compile_pair(".*:out", "system:playback_1"))
+    assert index.could_match_client("other")
+
+
+@pytest.mark.parametrize('template, exact_matching, client', [
+    ("system:playback_1", False, "system"),
+    ("system:playback_{ch}", False, "system"),
+    ("mon:in|rec:Main In", False, None),
+    ("mon:in_{n}|rec:in", False, None),
+    ("{client}:in", False, None),
+    ("(?i)mon:in", False, None),
+    ("mon.x:in", False, None),
+    ("mon.x:in", True, "mon.x"),
+    ("/mon:in|rec:in/", True, None),
+    ("{client}:in", True, None),
+])
+def test_template_client_prefix(template, exact_matching, client):
+    assert template_client_prefix(template, exact_matching) == client
+
+
+def test_could_match_client_with_alternatives_in_template():
+    index = PatternIndex()
+    index.add(*compile_pair("synth:out", "mon:in|rec:Main In"))
+    assert index.could_match_client("rec")
+
+
+def test_template_cache_resolves_and_counts():
+    cache = TemplateCache(maxsize=2)
+    match = re.match(r"synth:out_(?P<ch>\d)", "synth:out_1")
+    resolved = cache.resolve("system:playback_{ch}", match)
+    assert resolved.pattern == "system:playback_1"
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    assert cache.resolve("system:playback_{ch}", match) is resolved
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.currsize == 1
+
+
+def test_template_cache_evicts_least_recently_used():
+    cache = TemplateCache(maxsize=2)
+    rx = re.compile(r"synth:out_(?P<ch>\d)")
+    first = cache.resolve("sys:in_{ch}", rx.match("synth:out_1"))
+    cache.resolve("sys:in_{ch}", rx.match("synth:out_2"))
+    # make entry for 1 the most recently used one
+    cache.resolve("sys:in_{ch}", rx.match("synth:out_1"))
+    cache.resolve("sys:in_{ch}", rx.match("synth:out_3"))
+    assert cache.currsize == 2
+    assert cache.resolve("sys:in_{ch}", rx.match("synth:out_1")) is first
+    misses = cache.misses
+    cache.resolve("sys:in_{ch}", rx.match("synth:out_2"))
+    assert cache.misses == misses + 1
+
+
+def test_template_cache_static_templates():
+    cache = TemplateCache(maxsize=1)
+    cache.prepare("system:playback_1")
+    cache.resolve("system:playback_1", True)
+    cache.resolve("system:playback_1", re.match("a", "a"))
+    assert (cache.hits, cache.misses) == (2, 0)
+    assert cache.currsize == 0
+
+
+def test_template_cache_exact_matching():
+    cache = TemplateCache(exact_matching=True)
+    assert cache.resolve("system:playback_1", True) == "system:playback_1"
+    assert cache.resolve("/system:playback_\\d/", True).pattern == "system:playback_\\d"
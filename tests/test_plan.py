@@ -0,0 +1,61 @@
+"""Tests for evaluating patterns offline against a port graph snapshot."""
+
+import io
+import json
+
+import jacklib
+
+from jackmatchmaker import main
+from jackmatchmaker.plan import run_plan
+
+
+def save_snapshot(server, capsys, tmp_path):
+    server.register_port('synth:out_1', aliases=['alsa:synth_1'])
+    server.register_port('synth:out_2', pretty_name='Right')
+    server.register_port('mix:in', flags=jacklib.JackPortIsInput)
+    server.register_port('rec:in_1', flags=jacklib.JackPortIsInput)
+    server.register_port('rec:in_2', flags=jacklib.JackPortIsInput)
+    server.connect('synth:out_2', 'mix:in')
+    main(['-oican', '--format', 'json'])
+    path = tmp_path / 'snapshot.json'
+    path.write_text(capsys.readouterr().out)
+    return str(path)
+
+
+def test_plan_text_output(server, capsys, tmp_path):
+    snapshot = save_snapshot(server, capsys, tmp_path)
+    fp = io.StringIO()
+    assert run_plan(snapshot, [('alsa:synth_(?P<n>\\d)', 'rec:in_{n}'), ('mix:in', 'rec:in_1')],
+                    fp=fp) is None
+    lines = fp.getvalue().splitlines()
+    # mirrored connection after the connection it results from
+    assert lines[:6] == ['synth:out_1', '    rec:in_1', '', 'synth:out_2', '    rec:in_1', '']
+    assert lines[6] == "# sources    pairs  time [ms]  pattern pair"
+    assert lines[7].startswith("#       1        1 ")
+    assert lines[7].endswith("'alsa:synth_(?P<n>\\d)' --> 'rec:in_{n}'")
+    assert lines[8].startswith("#       1        1 ")
+    assert lines[-1].startswith("# 2 connection(s) planned for 5 port(s) and 2 pattern pair(s)")
+
+
+def test_plan_json_output_and_pretty_names(server, capsys, tmp_path):
+    snapshot = save_snapshot(server, capsys, tmp_path)
+    fp = io.StringIO()
+    run_plan(snapshot, [('synth:Right', 'rec:in_2')], format='json', fp=fp)
+    plan = json.loads(fp.getvalue())
+    assert plan['connections'] == [dict(output='synth:out_2', input='rec:in_2')]
+    assert plan['rules'][0]['output'] == 'synth:Right'
+    assert plan['summary'][0]['connections'] == 1
+
+
+def test_plan_ignores_aliases_if_requested(server, capsys, tmp_path):
+    snapshot = save_snapshot(server, capsys, tmp_path)
+    fp = io.StringIO()
+    run_plan(snapshot, [('alsa:synth_1', 'rec:in_1')], match_aliases=False, format='json',
+             fp=fp)
+    assert json.loads(fp.getvalue())['connections'] == []
+
+
+def test_plan_fails_for_invalid_snapshot(tmp_path):
+    path = tmp_path / 'snapshot.json'
+    path.write_text('{"ports": []}')
+    assert run_plan(str(path), [('a', 'b')]).startswith("Could not read file")
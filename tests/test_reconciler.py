@@ -0,0 +1,103 @@
+"""Tests for computing missing, mirrored and unmirrored connections."""
+
+from jackmatchmaker.graph import PORT_IS_INPUT, PORT_IS_OUTPUT, Graph, Port
+from jackmatchmaker.reconciler import Reconciler
+
+
+def make_graph(outputs=(), inputs=(), connections=()):
+    graph = Graph()
+
+    for name in outputs:
+        graph.add(Port(name, flags=PORT_IS_OUTPUT))
+
+    for name in inputs:
+        graph.add(Port(name, flags=PORT_IS_INPUT))
+
+    for src, dst in connections:
+        graph.connect(src, dst)
+
+    return graph
+
+
+def test_missing_skips_existing_pending_and_vanished():
+    graph = make_graph(['a:out', 'b:out', 'c:out'], ['x:in', 'y:in'], [('a:out', 'x:in')])
+    rec = Reconciler(graph)
+    rec.add('a:out', 'x:in')
+    rec.add('a:out', 'y:in')
+    rec.add('b:out', 'x:in')
+    rec.add('c:out', 'gone:in')
+    rec.pending.add(('b:out', 'x:in'))
+
+    assert rec.missing() == {('a:out', 'y:in'): ('a:out', 'y:in')}
+    assert not rec.add('a:out', 'y:in')
+
+
+def test_missing_for_input_source_maps_to_pair():
+    graph = make_graph(['a:out', 'b:out'], ['mix:in', 'rec:in'],
+                       [('a:out', 'mix:in'), ('b:out', 'mix:in')])
+    rec = Reconciler(graph)
+    rec.add('mix:in', 'rec:in')
+
+    missing = rec.missing()
+    assert sorted(missing) == [('a:out', 'rec:in'), ('b:out', 'rec:in')]
+    assert set(missing.values()) == {('mix:in', 'rec:in')}
+
+
+def test_mirrored_and_plan():
+    graph = make_graph(['a:out'], ['mix:in', 'rec:in', 'tape:in'])
+    rec = Reconciler(graph)
+    rec.add('a:out', 'mix:in')
+    rec.add('mix:in', 'rec:in')
+    rec.add('rec:in', 'tape:in')
+
+    assert rec.mirrored([('a:out', 'mix:in')]) == [('mix:in', 'rec:in')]
+    assert rec.plan() == [('a:out', 'mix:in'), ('a:out', 'rec:in'), ('a:out', 'tape:in')]
+    assert rec.missing() == {}
+
+
+def test_plan_is_sorted():
+    graph = make_graph(['b:out', 'a:out', 'c:out'], ['y:in', 'x:in', 'mix:in'])
+    rec = Reconciler(graph)
+
+    for src in ('c:out', 'a:out', 'b:out'):
+        for dst in ('y:in', 'mix:in', 'x:in'):
+            rec.add(src, dst)
+
+    rec.add('mix:in', 'z:in')
+    graph.add(Port('z:in', flags=PORT_IS_INPUT))
+    plan = rec.plan()
+    assert plan[:9] == sorted(plan[:9])
+    assert plan[9:] == [('a:out', 'z:in'), ('b:out', 'z:in'), ('c:out', 'z:in')]
+
+
+def test_unmirrored_only_removes_undesired_mirrors():
+    graph = make_graph(['a:out', 'keep:out'], ['mix:in', 'rec:in'],
+                       [('keep:out', 'mix:in'), ('a:out', 'rec:in'), ('keep:out', 'rec:in')])
+    rec = Reconciler(graph)
+    rec.add('mix:in', 'rec:in')
+    rec.add('keep:out', 'rec:in')
+    rec.mirrors.update([('a:out', 'rec:in'), ('keep:out', 'rec:in')])
+
+    # a:out --> mix:in was removed (the graph no longer has it)
+    assert rec.unmirrored([('a:out', 'mix:in')]) == [('a:out', 'rec:in')]
+    # keep:out --> rec:in is also desired directly
+    graph.disconnect('keep:out', 'mix:in')
+    assert rec.unmirrored([('keep:out', 'mix:in')]) == []
+
+
+def test_is_desired():
+    graph = make_graph(['a:out', 'b:out'], ['mix:in', 'rec:in'], [('a:out', 'mix:in')])
+    rec = Reconciler(graph)
+    rec.add('mix:in', 'rec:in')
+    rec.add('b:out', 'mix:in')
+    assert rec.is_desired('a:out', 'rec:in')
+    assert rec.is_desired('b:out', 'mix:in')
+    assert not rec.is_desired('b:out', 'rec:in')
+
+
+def test_forget():
+    graph = make_graph(['a:out'], ['x:in'])
+    rec = Reconciler(graph)
+    rec.add('a:out', 'x:in')
+    rec.forget('x:in', as_source=False)
+    assert rec.matches == {} and rec.matched_by == {}
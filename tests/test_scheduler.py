@@ -0,0 +1,166 @@
+"""Tests for the connection scheduler, driven by a simulated clock."""
+
+import pytest
+
+from jackmatchmaker import scheduler as scheduler_module
+from jackmatchmaker.loop import Timer
+from jackmatchmaker.metrics import Metrics
+from jackmatchmaker.scheduler import ConnectionScheduler
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeLoop(object):
+    """Collects timers and runs them, when the simulated clock is advanced."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.timers = []
+
+    def call_at(self, when, callback, *args):
+        timer = Timer(when, callback, args)
+        self.timers.append(timer)
+        return timer
+
+    def advance(self, seconds):
+        end = self.clock.now + seconds
+
+        while True:
+            due = sorted((t for t in self.timers if not t.cancelled and t.when <= end),
+                         key=lambda t: t.when)
+
+            if not due:
+                break
+
+            timer = due[0]
+            self.timers.remove(timer)
+            self.clock.now = max(self.clock.now, timer.when)
+            timer.callback(*timer.args)
+
+        self.clock.now = end
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler_module, 'time', clock)
+    return clock
+
+
+def make_scheduler(clock, results=None, **kwargs):
+    made = []
+    results = results or {}
+
+    def connect(conn):
+        result = results.get(conn, True)
+
+        if isinstance(result, list):
+            result = result.pop(0) if result else True
+
+        if result:
+            made.append(conn)
+
+        return result
+
+    loop = FakeLoop(clock)
+    return ConnectionScheduler(loop, connect, **kwargs), loop, made
+
+
+def test_flush_makes_connections_in_order_of_priority(clock):
+    sched, loop, made = make_scheduler(clock)
+    sched.submit(('a', '1'))
+    sched.submit(('b', '1'), priority=5)
+    sched.submit(('c', '1'), priority=1)
+    # raising the priority of a queued connection
+    sched.submit(('a', '1'), priority=9)
+    # lower priority for already queued connection is ignored
+    sched.submit(('b', '1'), priority=0)
+
+    assert len(sched) == 3
+    assert sched.flush() == 3
+    assert made == [('a', '1'), ('b', '1'), ('c', '1')]
+    assert len(sched) == 0
+
+
+def test_window_collects_connections(clock):
+    sched, loop, made = make_scheduler(clock, window=0.05)
+    sched.submit(('a', '1'))
+    assert sched.flush() == 0
+    sched.submit(('b', '1'), priority=1)
+    sched.flush()
+    assert made == []
+
+    loop.advance(0.05)
+    assert made == [('b', '1'), ('a', '1')]
+
+
+def test_rate_limit_spaces_connections(clock):
+    sched, loop, made = make_scheduler(clock, rate=10)
+
+    for i in range(5):
+        sched.submit(('a', str(i)))
+
+    assert sched.flush() == 1
+    loop.advance(0.25)
+    assert len(made) == 3
+    loop.advance(1)
+    assert len(made) == 5
+    assert not [t for t in loop.timers if not t.cancelled]
+
+
+def test_retry_with_backoff(clock):
+    metrics = Metrics()
+    metrics.counter('connect_retries_total', "")
+    metrics.histogram('connect_queue_seconds', "")
+    conn = ('a', '1')
+    sched, loop, made = make_scheduler(clock, {conn: [False, False]}, retry_interval=0.5,
+                                       metrics=metrics)
+    sched.submit(conn)
+    assert sched.flush() == 0
+    assert len(sched) == 1
+
+    loop.advance(0.4)
+    assert made == []
+    # first retry after 0.5 s fails, second one 1 s later succeeds
+    loop.advance(0.2)
+    assert made == []
+    loop.advance(1.0)
+    assert made == [conn]
+    assert len(sched) == 0
+    assert 'jack_matchmaker_connect_retries_total 2' in metrics.render()
+
+
+def test_give_up_after_max_retries(clock):
+    conn = ('a', '1')
+    sched, loop, made = make_scheduler(clock, {conn: False}, max_retries=2, retry_interval=0.1)
+    sched.submit(conn)
+    sched.flush()
+    loop.advance(10)
+    assert made == []
+    assert len(sched) == 0
+
+
+def test_connections_not_needed_anymore_are_dropped(clock):
+    conn = ('a', '1')
+    sched, loop, made = make_scheduler(clock, {conn: None}, rate=1)
+    sched.submit(conn)
+    sched.submit(('b', '1'))
+    # None does not count against the rate limit
+    assert sched.flush() == 1
+    assert made == [('b', '1')]
+
+
+def test_clear_cancels_timer(clock):
+    sched, loop, made = make_scheduler(clock, window=1)
+    sched.submit(('a', '1'))
+    sched.flush()
+    sched.clear()
+    loop.advance(2)
+    assert made == []
+    assert len(sched) == 0
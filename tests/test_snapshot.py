@@ -0,0 +1,75 @@
+"""Tests for saving and loading port graph snapshots."""
+
+import io
+import json
+
+import pytest
+
+from jackmatchmaker.graph import MIDI_TYPE, PORT_IS_INPUT, PORT_IS_OUTPUT, Graph, Port
+from jackmatchmaker.listing import ListingWriter
+from jackmatchmaker.snapshot import graph_snapshot, load_snapshot
+
+
+def make_graph():
+    graph = Graph()
+    graph.add(Port('synth:out', flags=PORT_IS_OUTPUT, aliases=['alsa:synth'],
+                   pretty_name='Synth', uuid=1))
+    graph.add(Port('synth:midi_out', type=MIDI_TYPE, flags=PORT_IS_OUTPUT, uuid=2))
+    graph.add(Port('rec:in', flags=PORT_IS_INPUT, uuid=3))
+    graph.connect('synth:out', 'rec:in')
+    return graph
+
+
+def write_listing(graph, format, sections=('outputs', 'inputs', 'connections')):
+    fp = io.StringIO()
+    writer = ListingWriter(fp, format)
+
+    if 'outputs' in sections:
+        writer.write_ports(list(graph.outputs()), 'outputs')
+
+    if 'inputs' in sections:
+        writer.write_ports(list(graph.inputs()), 'inputs')
+
+    if 'connections' in sections:
+        writer.write_connections(sorted((src, dst) for src, dsts in graph.connections.items()
+                                        for dst in dsts))
+
+    writer.close()
+    return fp.getvalue()
+
+
+def load(tmp_path, data):
+    path = tmp_path / 'snapshot.json'
+    path.write_text(data)
+    return load_snapshot(str(path))
+
+
+def assert_same_graph(graph, expected):
+    assert graph_snapshot(graph) == graph_snapshot(expected)
+
+
+@pytest.mark.parametrize('format', ['json', 'jsonl'])
+def test_listing_round_trip(tmp_path, format):
+    graph = make_graph()
+    assert_same_graph(load(tmp_path, write_listing(graph, format)), graph)
+
+
+def test_control_socket_snapshot_round_trip(tmp_path):
+    graph = make_graph()
+    assert_same_graph(load(tmp_path, json.dumps(graph_snapshot(graph))), graph)
+
+
+def test_json_lines_with_single_record(tmp_path):
+    graph = Graph()
+    graph.add(Port('synth:out', flags=PORT_IS_OUTPUT, aliases=[], uuid=1))
+    data = write_listing(graph, 'jsonl', sections=('outputs',))
+    assert len(data.splitlines()) == 1
+    loaded = load(tmp_path, data)
+    assert [port.name for port in loaded] == ['synth:out']
+
+
+@pytest.mark.parametrize('data', ['', '[1, 2]\n', '{"ports": []}\n', '{"name": "a:out"}\n',
+                                  '{"kind": "output"}\n', 'no json\n'])
+def test_invalid_snapshot(tmp_path, data):
+    with pytest.raises(ValueError):
+        load(tmp_path, data)
@@ -0,0 +1,32 @@
+"""Tests for the match decision tracer."""
+
+import re
+
+from jackmatchmaker.patterns import compile_pair
+from jackmatchmaker.trace import MatchTracer
+
+
+def test_samples_per_rule_not_per_resolved_pattern():
+    tracer = MatchTracer(size=100, sample=3)
+    pair = compile_pair(r"synth:out_(?P<n>\d+)", "system:playback_{n}")
+
+    for i in range(30):
+        # each source port resolves the template of the pair to a different input port pattern
+        ptn_input = re.compile("system:playback_%i" % i)
+        tracer.record('destination', 'system:playback_%i' % i, 'system:playback_%i' % i,
+                      ptn_input, True, pair)
+
+    assert tracer.total == 30
+    assert len(tracer) == 10
+    assert len(tracer._counts) == 1
+
+
+def test_ring_buffer_keeps_most_recent_decisions():
+    tracer = MatchTracer(size=2)
+
+    for i in range(3):
+        tracer.record('source', 'a:out_%i' % i, 'a:out_%i' % i, None, False)
+
+    assert [record['port'] for record in tracer.dump()] == ['a:out_1', 'a:out_2']
+    tracer.clear()
+    assert len(tracer) == 0
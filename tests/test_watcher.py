@@ -0,0 +1,79 @@
+"""Tests for watching the pattern file with inotify and by polling."""
+
+import os
+import select
+
+import pytest
+
+from jackmatchmaker import watcher
+from jackmatchmaker.watcher import FileWatcher
+
+
+def wait_readable(fd, timeout=5):
+    return bool(select.select([fd], [], [], timeout)[0])
+
+
+@pytest.fixture
+def pattern_file(tmp_path):
+    path = tmp_path / 'patterns.txt'
+    path.write_text("a:out\n    b:in\n")
+    return path
+
+
+@pytest.fixture
+def inotify_watcher(pattern_file):
+    changes = []
+    fw = FileWatcher(str(pattern_file), lambda: changes.append(True))
+
+    if fw.open() is None:
+        pytest.skip("inotify not available")
+
+    yield fw, changes
+    fw.close()
+
+
+def test_inotify_reports_write(pattern_file, inotify_watcher):
+    fw, changes = inotify_watcher
+    pattern_file.write_text("c:out\n    d:in\n")
+    assert wait_readable(fw.fd)
+    fw.read_events()
+    assert changes == [True]
+
+
+def test_inotify_reports_replaced_file(pattern_file, inotify_watcher):
+    fw, changes = inotify_watcher
+    tmp = pattern_file.with_name('patterns.txt.new')
+    tmp.write_text("c:out\n    d:in\n")
+    assert wait_readable(fw.fd)
+    # writing another file in the directory does not call the callback
+    fw.read_events()
+    assert changes == []
+
+    os.replace(str(tmp), str(pattern_file))
+    assert wait_readable(fw.fd)
+    fw.read_events()
+    assert changes == [True]
+
+
+def test_polling_detects_changes(pattern_file, monkeypatch):
+    monkeypatch.setattr(watcher, '_load_inotify', lambda: None)
+    changes = []
+    fw = FileWatcher(str(pattern_file), lambda: changes.append(True), poll_interval=0.1)
+    assert fw.open() is None
+
+    fw.check()
+    assert changes == []
+
+    pattern_file.write_text("c:out\n    d:in\n    e:in\n")
+    fw.check()
+    assert changes == [True]
+    fw.check()
+    assert changes == [True]
+
+    # a removed file is not reported, but it re-appearing is
+    pattern_file.unlink()
+    fw.check()
+    assert changes == [True]
+    pattern_file.write_text("a:out\n    b:in\n")
+    fw.check()
+    assert changes == [True, True]